@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import xfcp.cobs_codec
+
+
+# byte at a time reference implementation (original SerialInterface codec)
+def ref_cobs_encode(block):
+    block = bytearray(block)
+    enc = bytearray()
+
+    seg = bytearray()
+    code = 1
+
+    new_data = True
+
+    for b in block:
+        if b == 0:
+            enc.append(code)
+            enc.extend(seg)
+            code = 1
+            seg = bytearray()
+            new_data = True
+        else:
+            code += 1
+            seg.append(b)
+            new_data = True
+            if code == 255:
+                enc.append(code)
+                enc.extend(seg)
+                code = 1
+                seg = bytearray()
+                new_data = False
+
+    if new_data:
+        enc.append(code)
+        enc.extend(seg)
+
+    return bytes(enc)
+
+
+def ref_cobs_decode(block):
+    block = bytearray(block)
+    dec = bytearray()
+
+    code = 0
+
+    i = 0
+
+    if 0 in block:
+        return None
+
+    while i < len(block):
+        code = block[i]
+        i += 1
+        if i+code-1 > len(block):
+            return None
+        dec.extend(block[i:i+code-1])
+        i += code-1
+        if code < 255 and i < len(block):
+            dec.append(0)
+
+    return bytes(dec)
+
+
+def gen_data(pattern, size):
+    if pattern == 'random':
+        return os.urandom(size)
+    if pattern == 'zeros':
+        return bytes(size)
+    if pattern == 'registers':
+        # mostly small 32 bit values, like a register dump
+        rnd = random.Random(0)
+        return b''.join(rnd.randrange(0, 4096).to_bytes(4, 'little') for k in range(size//4))
+    raise ValueError(pattern)
+
+
+def bench(func, data, min_time):
+    count = 0
+    start = time.perf_counter()
+    while True:
+        func(data)
+        count += 1
+        t = time.perf_counter()-start
+        if t >= min_time:
+            return len(data)*count/t/1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--size', type=int, default=65536, help="Block size")
+    parser.add_argument('-t', '--time', type=float, default=1.0, help="Minimum time per measurement")
+
+    args = parser.parse_args()
+
+    print("fast path: %s" % ('cobs module' if xfcp.cobs_codec._cobs is not None else 'pure python'))
+    print("%-10s %-7s %12s %12s %8s" % ('pattern', 'op', 'ref MB/s', 'new MB/s', 'speedup'))
+
+    for pattern in ['random', 'zeros', 'registers']:
+        data = gen_data(pattern, args.size)
+        enc = ref_cobs_encode(data)
+
+        # encoders may differ on data ending with a full 254 byte block
+        # (the cobs module appends an empty group), so check round trips
+        assert ref_cobs_decode(xfcp.cobs_codec.cobs_encode(data)) == data
+        assert xfcp.cobs_codec.cobs_decode(enc) == data
+        assert xfcp.cobs_codec.cobs_decode(xfcp.cobs_codec.cobs_encode(data)) == data
+
+        for op, ref, new, arg in [
+                ('encode', ref_cobs_encode, xfcp.cobs_codec.cobs_encode, data),
+                ('decode', ref_cobs_decode, xfcp.cobs_codec.cobs_decode, enc)]:
+            r = bench(ref, arg, args.time)
+            n = bench(new, arg, args.time)
+            print("%-10s %-7s %12.2f %12.2f %7.1fx" % (pattern, op, r, n, n/r))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import xfcp.packet
+
+
+# original list and bytearray based implementation, for reference
+class RefPacket(object):
+    def __init__(self, payload=b'', path=(), rpath=(), ptype=0):
+        self.payload = payload
+        self.path = path
+        self.rpath = rpath
+        self.ptype = ptype
+
+        if isinstance(payload, RefPacket):
+            self.payload = bytes(payload.payload)
+            self.path = tuple(payload.path)
+            self.rpath = tuple(payload.rpath)
+            self.ptype = payload.ptype
+
+    def build(self):
+        data = bytearray()
+
+        for p in self.path:
+            data.append(p)
+
+        if len(self.rpath) > 0:
+            data.append(0xFE)
+            for p in self.rpath:
+                data.append(p)
+
+        data.append(0xFF)
+        data.append(self.ptype)
+
+        data.extend(self.payload)
+
+        return bytes(data)
+
+    def parse(self, data):
+        i = 0
+
+        data = bytearray(data)
+
+        self.path = []
+        self.rpath = []
+
+        while i < len(data) and data[i] < 0xFE:
+            self.path.append(data[i])
+            i += 1
+
+        if data[i] == 0xFE:
+            i += 1
+            while i < len(data) and data[i] < 0xFE:
+                self.rpath.append(data[i])
+                i += 1
+
+        assert data[i] == 0xFF
+        i += 1
+
+        self.ptype = data[i]
+        i += 1
+
+        self.payload = bytes(data[i:])
+
+
+class RefMemoryAccessPacket(RefPacket):
+    def __init__(self, payload=b'', path=(), rpath=(), ptype=0):
+        super().__init__(payload, path, rpath, ptype)
+
+        self.addr = 0
+        self.count = 0
+        self.data = b''
+        self.addr_width = 32
+        self.count_width = 16
+
+    def build(self):
+        aw = (self.addr_width+7)//8
+        cw = (self.count_width+7)//8
+        self.payload = self.addr.to_bytes(aw, 'little')
+        self.payload += self.count.to_bytes(cw, 'little')
+        self.payload += self.data
+
+        return super().build()
+
+    def parse(self, data=None):
+        if data is not None:
+            super().parse(data)
+
+        aw = (self.addr_width+7)//8
+        cw = (self.count_width+7)//8
+        self.addr = int.from_bytes(self.payload[0:aw], 'little')
+        self.count = int.from_bytes(self.payload[aw:aw+cw], 'little')
+        self.data = self.payload[aw+cw:]
+
+
+def ref_parse(data):
+    pkt = RefPacket()
+    pkt.parse(data)
+    if pkt.ptype in (0x10, 0x11, 0x12, 0x13):
+        return RefMemoryAccessPacket(pkt)
+    return pkt
+
+
+def make_request(cls, size):
+    pkt = cls()
+    pkt.path = (3, 1)
+    pkt.rpath = (0, 42)
+    pkt.ptype = 0x12
+    pkt.addr = 0x1000
+    pkt.data = bytes(size)
+    pkt.count = size
+    pkt.addr_width = 32
+    pkt.count_width = 16
+    return pkt
+
+
+def ref_round_trip(args):
+    pkt, data = args
+    pkt.build()
+    r = ref_parse(data)
+    r.parse()
+    return r.data
+
+
+def new_round_trip(args):
+    pkt, data = args
+    pkt.build()
+    r = xfcp.packet.parse(data)
+    r.parse()
+    return r.data
+
+
+def bench(func, arg, min_time):
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for k in range(100):
+            func(arg)
+        count += 100
+        t = time.perf_counter()-start
+        if t >= min_time:
+            return count/t
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-t', '--time', type=float, default=1.0, help="Minimum time per measurement")
+
+    args = parser.parse_args()
+
+    print("%-8s %14s %14s %8s" % ('payload', 'ref pkt/s', 'new pkt/s', 'speedup'))
+
+    for size in [4, 64, 1024, 8192]:
+        ref_pkt = make_request(RefMemoryAccessPacket, size)
+        new_pkt = make_request(xfcp.packet.WriteRequestPacket, size)
+        data = new_pkt.build()
+
+        assert ref_pkt.build() == data
+        assert bytes(new_round_trip((new_pkt, data))) == ref_round_trip((ref_pkt, data))
+
+        r = bench(ref_round_trip, (ref_pkt, data), args.time)
+        n = bench(new_round_trip, (new_pkt, data), args.time)
+        print("%-8d %14.0f %14.0f %7.1fx" % (size, r, n, n/r))
+
+
+if __name__ == "__main__":
+    main()
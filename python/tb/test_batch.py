@@ -0,0 +1,90 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import xfcp.batch
+import xfcp.node
+
+import xfcp_model
+
+
+class CountingInterface(xfcp_model.LoopbackInterface):
+    def __init__(self, device, window=1, max_packet_size=None):
+        super().__init__(device, window, max_packet_size)
+        self.max_pending = 0
+
+    def send(self, pkt):
+        self.max_pending = max(self.max_pending, len(self.pending))
+        super().send(pkt)
+
+
+def test_batch_split():
+    dev = xfcp_model.make_device()
+    intf = xfcp_model.LoopbackInterface(dev, window=4, max_packet_size=64)
+    n = intf.enumerate()[0]
+
+    data = bytes(range(256))*2
+    with n.batch() as b:
+        w = b.write(0x10, data)
+        r = b.read(0x10, len(data))
+        ww = b.write_words(0x400, range(100))
+        rw = b.read_words(0x400, 100)
+
+    # one request per packet sized chunk, results reassembled
+    assert dev.root.children[0].writes == len(n.split(0x10, len(data)))+len(n.split(0x400, 200))
+    assert len(n.split(0x10, len(data))) > 1
+    assert w.result() == len(data)
+    assert r.result() == data
+    assert ww.result() == 100
+    assert rw.result() == list(range(100))
+    assert all(len(pkt.build()) <= 64 for pkt in dev.requests)
+
+
+def test_batch_window():
+    dev0 = xfcp_model.make_device()
+    dev1 = xfcp_model.make_device()
+    intf0 = CountingInterface(dev0, window=1)
+    intf1 = CountingInterface(dev1, window=1)
+    n0 = intf0.enumerate()[0]
+    n1 = intf1.enumerate()[0]
+    intf1.max_pending = 0
+
+    # batch on intf0, most ops on a node behind intf1
+    with xfcp.batch.Batch(intf0, n0, window=8) as b:
+        ops = [b.read(k*4, 4, node=n1) for k in range(16)]
+        ops.append(b.read(0, 4))
+
+    assert all(op.done() for op in ops)
+    assert intf1.max_pending == 8
+    assert intf0.window == 1 and intf1.window == 1
+
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_batch_split()
+    test_batch_window()
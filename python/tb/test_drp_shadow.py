@@ -0,0 +1,115 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import xfcp.gty_node
+
+import xfcp_model
+
+
+def make_shadow_channel():
+    ch, drp = xfcp_model.make_channel(0x8A83)
+    assert isinstance(ch, xfcp.gty_node.GTYE3ChannelNode)
+    ch.enable_shadow()
+    return ch, drp
+
+
+def test_shadow_write():
+    ch, drp = make_shadow_channel()
+
+    ch.write_word(0x20, 0x1234)
+    reads = drp.reads
+    assert ch.read_reg(0x20) == 0x1234
+    assert drp.reads == reads
+
+    ch.masked_write(0x20, 0x00f0, 0x0050)
+    assert drp.reads == reads
+    assert ch.read_reg(0x20) == 0x1254
+    assert drp.mem[0x20:0x22] == b'\x54\x12'
+
+    # changed behind our back
+    drp.mem[0x20:0x22] = b'\x00\x00'
+    assert ch.read_reg(0x20) == 0x1254
+    ch.invalidate(0x20)
+    assert ch.read_reg(0x20) == 0
+
+
+def test_shadow_batch_write():
+    ch, drp = make_shadow_channel()
+
+    ch.write_word(0x40, 0x1111)
+    ch.write_word(0x42, 0x2222)
+    assert ch.read_reg(0x40) == 0x1111
+
+    with ch.batch() as b:
+        b.write_word(0x40, 0xaaaa)
+        b.write_words(0x42, [0xbbbb, 0xcccc])
+
+        # nothing sent yet, shadow still matches the device
+        assert ch.read_reg(0x40) == 0x1111
+
+    reads = drp.reads
+    assert ch.read_reg(0x40) == 0xaaaa
+    assert ch.read_reg(0x42) == 0xbbbb
+    assert ch.read_reg(0x44) == 0xcccc
+    assert drp.reads == reads
+
+    with ch.batch() as b:
+        b.masked_write(0x40, 0x00ff, 0x0055)
+
+    assert ch.read_reg(0x40) == 0xaa55
+    assert drp.mem[0x40:0x42] == b'\x55\xaa'
+
+
+def test_shadow_field():
+    ch, drp = make_shadow_channel()
+
+    ch.write_field(0x123456789abc, (0x60, 2), (0x80, 1))
+    reads = drp.reads
+    assert ch.read_reg(0x60) == 0x9abc
+    assert ch.read_reg(0x62) == 0x5678
+    assert ch.read_reg(0x80) == 0x1234
+    assert drp.reads == reads
+
+    assert ch.read_field((0x60, 2), (0x80, 1)) == 0x123456789abc
+
+
+def test_shadow_volatile():
+    ch, drp = make_shadow_channel()
+
+    ch.write_word(0xfe00, 0x0001)
+    drp.mem[0xfe00:0xfe02] = b'\x02\x00'
+    assert ch.read_reg(0xfe00) == 0x0002
+
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_shadow_write()
+    test_shadow_batch_write()
+    test_shadow_field()
+    test_shadow_volatile()
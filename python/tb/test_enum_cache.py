@@ -0,0 +1,145 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import xfcp.enum_cache
+import xfcp.node
+
+import xfcp_model
+
+
+def enumerate_cached(intf, filename, lazy=False, spot_checks=2):
+    intf.device.requests.clear()
+    return intf.enumerate(cache=xfcp.enum_cache.EnumerationCache(filename, spot_checks), lazy=lazy)
+
+
+def test_cache_hit():
+    with tempfile.TemporaryDirectory() as d:
+        filename = os.path.join(d, 'cache.json')
+        intf = xfcp_model.LoopbackInterface(xfcp_model.make_device(), window=8)
+
+        tree = enumerate_cached(intf, filename)
+        assert os.path.exists(filename)
+        names = [n.name for n in tree.find_by_type(xfcp.node.MemoryNode)]
+        assert names == ['RAM0', 'RAM1', 'RAM2', 'RAM3']
+
+        tree = enumerate_cached(intf, filename)
+        assert [n.name for n in tree.find_by_type(xfcp.node.MemoryNode)] == names
+
+        # root, the switch and two spot checks, not the whole tree
+        paths = [pkt.path for pkt in intf.device.requests]
+        assert paths[:2] == [(), (1,)]
+        assert len(paths) == 4
+        assert set(paths[2:]) <= {(0,), (1, 0), (1, 1), (1, 2)}
+
+        tree = enumerate_cached(intf, filename, spot_checks=0)
+        assert [pkt.path for pkt in intf.device.requests] == [(), (1,)]
+
+
+def test_cache_stale_leaf():
+    with tempfile.TemporaryDirectory() as d:
+        filename = os.path.join(d, 'cache.json')
+        dev = xfcp_model.make_device()
+        intf = xfcp_model.LoopbackInterface(dev, window=8)
+
+        enumerate_cached(intf, filename)
+
+        # a leaf deep in the tree changes, root and switches do not
+        leaf = dev.root.children[1].children[2]
+        dev.root.children[1].children[2] = xfcp_model.MemoryModel('NEW', ntype=0x8002)
+
+        # spot checks covering every leaf catch it
+        tree = enumerate_cached(intf, filename, spot_checks=4)
+        assert tree[1][2].name == 'NEW'
+
+        tree = enumerate_cached(intf, filename, spot_checks=4)
+        assert tree[1][2].name == 'NEW'
+
+        dev.root.children[1].children[2] = leaf
+        tree = enumerate_cached(intf, filename, spot_checks=4)
+        assert tree[1][2].name == 'RAM3'
+
+
+def test_cache_stale_switch():
+    with tempfile.TemporaryDirectory() as d:
+        filename = os.path.join(d, 'cache.json')
+        dev = xfcp_model.make_device()
+        intf = xfcp_model.LoopbackInterface(dev, window=8)
+
+        enumerate_cached(intf, filename)
+
+        # switch replaced by a memory, its cached children must not be
+        # addressed
+        dev.root.children[1] = xfcp_model.MemoryModel('RAM1')
+
+        tree = enumerate_cached(intf, filename)
+        assert len(tree) == 2
+        assert isinstance(tree[1], xfcp.node.MemoryNode)
+        assert all(len(pkt.path) < 2 for pkt in dev.requests)
+
+
+def test_cache_lazy():
+    with tempfile.TemporaryDirectory() as d:
+        filename = os.path.join(d, 'cache.json')
+        dev = xfcp_model.make_device()
+        intf = xfcp_model.LoopbackInterface(dev, window=8)
+
+        enumerate_cached(intf, filename)
+
+        # ports are filled in from the cache, nothing past validation
+        tree = enumerate_cached(intf, filename, lazy=True, spot_checks=0)
+        assert [pkt.path for pkt in dev.requests] == [(), (1,)]
+        names = [n.name for n in tree.find_by_type(xfcp.node.MemoryNode)]
+        assert names == ['RAM0', 'RAM1', 'RAM2', 'RAM3']
+        assert len(dev.requests) == 2
+
+
+def test_cache_lazy_stale():
+    with tempfile.TemporaryDirectory() as d:
+        filename = os.path.join(d, 'cache.json')
+        dev = xfcp_model.make_device()
+        intf = xfcp_model.LoopbackInterface(dev, window=8)
+
+        enumerate_cached(intf, filename)
+        dev.root.children[1] = xfcp_model.MemoryModel('NEW')
+
+        # cache rejected, ports probed live
+        tree = enumerate_cached(intf, filename, lazy=True, spot_checks=0)
+        assert [pkt.path for pkt in dev.requests] == [(), (1,)]
+        assert tree[1].name == 'NEW'
+        assert [pkt.path for pkt in dev.requests][2:] == [(1,)]
+
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_cache_hit()
+    test_cache_stale_leaf()
+    test_cache_stale_switch()
+    test_cache_lazy()
+    test_cache_lazy_stale()
@@ -0,0 +1,68 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import xfcp.gty_node
+
+import xfcp_model
+
+
+def reg_words(drp, addr, count):
+    return [int.from_bytes(drp.mem[addr+k*2:addr+k*2+2], 'little') for k in range(count)]
+
+
+def test_gthe3_es_qualifier():
+    ch, drp = xfcp_model.make_channel(0x8A81)
+    assert isinstance(ch, xfcp.gty_node.GTHE3ChannelNode)
+
+    # 80 bit fields, low word at the lowest register
+    ch.set_es_qualifier(0x4444_3333_2222_1111_0000)
+    assert reg_words(drp, 0x003f*2, 5) == [0x0000, 0x1111, 0x2222, 0x3333, 0x4444]
+    assert ch.get_es_qualifier() == 0x4444_3333_2222_1111_0000
+
+    ch.set_es_qual_mask(0x9999_8888_7777_6666_5555)
+    assert reg_words(drp, 0x0044*2, 5) == [0x5555, 0x6666, 0x7777, 0x8888, 0x9999]
+    assert ch.get_es_qual_mask() == 0x9999_8888_7777_6666_5555
+
+
+def test_gtye3_es_qualifier():
+    ch, drp = xfcp_model.make_channel(0x8A83)
+    assert isinstance(ch, xfcp.gty_node.GTYE3ChannelNode)
+
+    # 160 bit fields, split over two register blocks
+    val = sum((0x1000*k+k) << 16*k for k in range(10))
+    ch.set_es_qualifier(val)
+    assert reg_words(drp, 0x003f*2, 5) == [0x1000*k+k for k in range(5)]
+    assert reg_words(drp, 0x00e7*2, 5) == [0x1000*k+k for k in range(5, 10)]
+    assert ch.get_es_qualifier() == val
+
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_gthe3_es_qualifier()
+    test_gtye3_es_qualifier()
@@ -0,0 +1,101 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import xfcp.enum_cache
+import xfcp.interface
+import xfcp.node
+
+import xfcp_model
+
+
+def start_boards(count, delay):
+    return [xfcp_model.UDPDeviceModel(xfcp_model.make_device(), delay=delay) for k in range(count)]
+
+
+def test_pool_enumerate():
+    models = start_boards(4, 0.05)
+
+    try:
+        with xfcp.interface.InterfacePool(timeout=2) as pool:
+            for m in models:
+                pool.add('127.0.0.1', m.port)
+
+            # 6 nodes per board, each board answers one request per 50 ms;
+            # the boards are enumerated together, not one after another
+            start = time.monotonic()
+            roots = pool.enumerate()
+            dt = time.monotonic()-start
+
+            assert [len(r.find_by_type(xfcp.node.MemoryNode)) for r in roots] == [4]*4
+            assert all(len(m.device.requests) == 6 for m in models)
+            assert dt < 2*6*0.05
+    finally:
+        for m in models:
+            m.close()
+
+
+def test_pool_enumerate_cache():
+    models = start_boards(3, 0.0)
+
+    try:
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, 'cache.json')
+
+            with xfcp.interface.InterfacePool(timeout=0.5) as pool:
+                for m in models:
+                    pool.add('127.0.0.1', m.port)
+                pool.enumerate(cache=xfcp.enum_cache.EnumerationCache(filename))
+
+            # one board changes its sub switch
+            models[1].device.root.children[1] = xfcp_model.MemoryModel('NEW')
+            for m in models:
+                m.device.requests.clear()
+
+            with xfcp.interface.InterfacePool(timeout=0.5) as pool:
+                for m in models:
+                    pool.add('127.0.0.1', m.port)
+                roots = pool.enumerate(cache=xfcp.enum_cache.EnumerationCache(filename, 0))
+
+            assert [len(r) for r in roots] == [2, 2, 2]
+            assert roots[1][1].name == 'NEW'
+            assert roots[2][1][2].name == 'RAM3'
+
+            # root and switch check, the changed board is enumerated again
+            assert [len(m.device.requests) for m in models] == [2, 4, 2]
+    finally:
+        for m in models:
+            m.close()
+
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_pool_enumerate()
+    test_pool_enumerate_cache()
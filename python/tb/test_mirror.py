@@ -0,0 +1,136 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import xfcp.mirror
+
+import xfcp_model
+
+
+def make_mirror(page_size=0x100, merge_gap=0):
+    dev = xfcp_model.make_device()
+    intf = xfcp_model.LoopbackInterface(dev, window=8)
+    n = intf.enumerate()[0]
+    ram = dev.root.children[0]
+    ram.mem[0x1000:0x2000] = bytes(range(256))*16
+    return xfcp.mirror.MemoryMirror(n, 0x1000, 0x800, page_size, merge_gap), dev, ram
+
+
+def flush_writes(m, dev):
+    # (addr, count) of the write requests sent by one flush
+    dev.requests.clear()
+    m.flush()
+    lst = []
+    for pkt in dev.requests:
+        if pkt.ptype == 0x12:
+            pkt.addr_width = m.node.byte_addr_width
+            pkt.count_width = m.node.count_width
+            pkt.parse()
+            lst.append((pkt.addr, len(pkt.data)))
+    return lst
+
+
+def test_flush_coalesce():
+    m, dev, ram = make_mirror()
+
+    m.write(0x1000, b'\xaa'*4)
+    m.write(0x1004, b'\xbb'*4)
+    m.write(0x1002, b'\xcc'*4)
+    m.write(0x1100, b'\xdd'*2)
+    assert m.dirty == [(0x0, 0x8), (0x100, 0x102)]
+
+    # touching and overlapping writes go out as one request
+    assert flush_writes(m, dev) == [(0x1000, 8), (0x1100, 2)]
+    assert ram.mem[0x1000:0x1008] == b'\xaa\xaa\xcc\xcc\xcc\xcc\xbb\xbb'
+    assert ram.mem[0x1100:0x1102] == b'\xdd\xdd'
+
+    assert flush_writes(m, dev) == []
+
+
+def test_flush_merge_gap():
+    m, dev, ram = make_mirror(merge_gap=16)
+
+    # gap of 4 cached bytes is rewritten, 32 is too far
+    m.write(0x1000, b'\x01'*4)
+    m.write(0x1008, b'\x02'*4)
+    m.write(0x1030, b'\x03'*4)
+    assert flush_writes(m, dev) == [(0x1000, 12), (0x1030, 4)]
+    assert ram.mem[0x1004:0x1008] == bytes(range(4, 8))
+
+    # gap page never fetched, so not merged even within merge_gap
+    m = xfcp.mirror.MemoryMirror(m.node, 0x1000, 0x800, 0x10, merge_gap=0x40)
+    m.write(0x100c, b'\x04'*4)
+    m.write(0x1020, b'\x05'*4)
+    assert not m.valid[1]
+    ram.mem[0x1010:0x1020] = b'\x5a'*16
+    assert flush_writes(m, dev) == [(0x100c, 4), (0x1020, 4)]
+    assert ram.mem[0x1010:0x1020] == b'\x5a'*16
+
+
+def test_flush_view():
+    m, dev, ram = make_mirror()
+
+    v = m.view(0x1000, 0x200)
+    v[0x10:0x14] = b'abcd'
+    v[0x20] = v[0x20]
+    v[0x1fe:0x200] = b'yz'
+
+    # only bytes that differ from the device are written
+    assert flush_writes(m, dev) == [(0x1010, 4), (0x11fe, 2)]
+    assert ram.mem[0x1010:0x1014] == b'abcd'
+    assert flush_writes(m, dev) == []
+
+    # read only views are not tracked
+    m.invalidate()
+    m.view(0x1000, 0x100, writable=False)
+    assert not m.exposed
+
+
+def test_invalidate_dirty():
+    m, dev, ram = make_mirror()
+
+    # dirty range over three pages, middle page dropped
+    m.write(0x1080, b'\xee'*0x200)
+    assert m.dirty == [(0x80, 0x280)]
+    m.invalidate(0x1100, 0x100)
+    assert m.dirty == [(0x80, 0x100), (0x200, 0x280)]
+    assert not m.valid[1]
+
+    assert flush_writes(m, dev) == [(0x1080, 0x80), (0x1200, 0x80)]
+    assert ram.mem[0x1100:0x1200] == bytes(range(256))
+
+    # dropped page is read again from the device
+    assert m.read(0x1100, 4) == bytes(range(4))
+
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_flush_coalesce()
+    test_flush_merge_gap()
+    test_flush_view()
+    test_invalidate_dirty()
@@ -0,0 +1,99 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import xfcp.i2c_node
+import xfcp.node
+import xfcp.packet
+
+import xfcp_model
+
+
+def test_parse_payload():
+    data = bytes([1, 2, 0xfe, 3, 4, 0xff, 0xff])+b'hello'
+    pkt = xfcp.packet.parse(data)
+
+    assert type(pkt.payload) is bytes
+    assert pkt.payload.decode() == 'hello'
+    assert pkt == xfcp.packet.IDResponsePacket(b'hello', (1, 2), (3, 4))
+    assert pkt.build() == data
+
+
+def test_i2c_payload():
+    pkt = xfcp.i2c_node.I2CResponsePacket()
+    pkt.pack_status_query(0)
+    pkt.pack_read(b'\x12\x34', start=True, stop=True)
+
+    pkt = xfcp.packet.parse(pkt.build())
+    assert type(pkt.payload) is bytes
+
+    # the pack methods extend the payload of a parsed packet in place
+    pkt.pack_status_query(1)
+    assert pkt.unpack_status_query() == 0
+    assert pkt.unpack_read() == (b'\x12\x34', True, True)
+    assert pkt.unpack_status_query() == 1
+
+
+def test_template_payload():
+    dev = xfcp_model.DeviceModel(xfcp_model.SwitchModel([xfcp_model.MemoryModel('RAM0')]))
+    intf = xfcp_model.LoopbackInterface(dev)
+    n = intf.enumerate()[0]
+
+    pkt = n.build_write(0x100, memoryview(b'abcd'))
+    pkt.rpath = (1, 2)
+    data = pkt.build()
+
+    ref = xfcp.packet.parse(data)
+    assert type(pkt.payload) is bytes
+    assert pkt.payload == ref.payload == b'\x00\x01\x04\x00abcd'
+    assert "payload=b'\\x00\\x01\\x04\\x00abcd'" in repr(pkt)
+    assert pkt == ref
+
+
+def test_subclass_init():
+    class TestPacket(xfcp.packet.Packet):
+        def __init__(self, payload=b'', path=(), rpath=(), ptype=0x7e):
+            super().__init__(payload, path, rpath, ptype)
+            self.extra = len(self.payload)
+
+    xfcp.packet.register(TestPacket, 0x7e)
+    try:
+        # parse goes through __init__, so subclass state is set up
+        pkt = xfcp.packet.parse(TestPacket(b'abc', (1,)).build())
+        assert type(pkt) is TestPacket
+        assert pkt.extra == 3
+    finally:
+        del xfcp.packet.packet_types[0x7e]
+
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_parse_payload()
+    test_i2c_payload()
+    test_template_payload()
+    test_subclass_init()
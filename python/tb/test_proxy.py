@@ -0,0 +1,164 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import os
+import socket
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import xfcp.interface
+import xfcp.node
+import xfcp.packet
+import xfcp.proxy
+
+import xfcp_model
+
+
+def start_proxy(dev, delay=0.0, window=4):
+    model = xfcp_model.UDPDeviceModel(dev, delay=delay)
+    upstream = xfcp.interface.UDPInterface('127.0.0.1', model.port, timeout=2, window=window)
+    proxy = xfcp.proxy.Proxy(upstream, timeout=2)
+    sock = proxy.listen_udp('127.0.0.1', 0)
+    thread = threading.Thread(target=proxy.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    return model, proxy, sock.getsockname()[1]
+
+
+def stop_proxy(model, proxy):
+    proxy.close()
+    model.close()
+
+
+def make_device():
+    # byte wide, so reads use every byte of a packet
+    return xfcp_model.make_device(data_width=8)
+
+
+def test_proxy_mtu():
+    model, proxy, port = start_proxy(make_device())
+
+    try:
+        assert proxy.max_packet_size == 1472
+
+        errors = []
+
+        def client(k):
+            try:
+                # full size packets, as on a direct link
+                intf = xfcp.interface.UDPInterface('127.0.0.1', port, timeout=2, window=4)
+                n = intf.enumerate().find_by_type(xfcp.node.MemoryNode)[k]
+                data = bytes((k*7+x) & 0xff for x in range(20000))
+                n.write(0, data)
+                assert n.read(0, len(data)) == data
+                intf.close()
+            except Exception as ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=client, args=(k,)) for k in range(4)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+
+        assert not errors, errors
+        assert model.oversize == 0
+        assert proxy.timeouts == 0
+        assert proxy.oversize == 0
+        assert proxy.responses == proxy.requests-proxy.duplicates
+    finally:
+        stop_proxy(model, proxy)
+
+
+def test_proxy_oversize():
+    model, proxy, port = start_proxy(make_device())
+
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(0.5)
+
+        # fits on the link once the missing tag is added
+        pkt = xfcp.packet.Packet(b'\x00\x00\x00\x00', (0,), (), 0x10)
+        sock.sendto(pkt.build(), ('127.0.0.1', port))
+        resp = xfcp.packet.parse(sock.recv(65536))
+        assert resp.ptype == 0x11 and resp.rpath == ()
+
+        # write with no rpath, 3 bytes over once tagged
+        pkt = xfcp.packet.Packet(b'\x00\x00\xb8\x05'+bytes(1464), (0,), (), 0x12)
+        assert len(pkt.build()) == 1471
+        sock.sendto(pkt.build(), ('127.0.0.1', port))
+        try:
+            sock.recv(65536)
+            assert False, "oversize request answered"
+        except socket.timeout:
+            pass
+        assert proxy.oversize == 1
+        assert model.oversize == 0
+
+        sock.close()
+    finally:
+        stop_proxy(model, proxy)
+
+
+def test_proxy_duplicates():
+    model, proxy, port = start_proxy(make_device(), delay=0.1)
+
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(1.0)
+
+        # retransmit while the first copy is in flight
+        data = xfcp.packet.Packet(b'\x00\x00\x04\x00', (0,), (5, 6), 0x10).build()
+        sock.sendto(data, ('127.0.0.1', port))
+        sock.sendto(data, ('127.0.0.1', port))
+
+        resp = xfcp.packet.parse(sock.recv(65536))
+        assert resp.rpath == (5, 6)
+        sock.settimeout(0.3)
+        try:
+            sock.recv(65536)
+            assert False, "duplicate request forwarded"
+        except socket.timeout:
+            pass
+
+        assert proxy.duplicates == 1
+        assert len(model.device.requests) == 1
+
+        # once answered, the same request is forwarded again
+        sock.settimeout(1.0)
+        sock.sendto(data, ('127.0.0.1', port))
+        assert xfcp.packet.parse(sock.recv(65536)).rpath == (5, 6)
+        assert len(model.device.requests) == 2
+
+        sock.close()
+    finally:
+        stop_proxy(model, proxy)
+
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_proxy_mtu()
+    test_proxy_oversize()
+    test_proxy_duplicates()
@@ -0,0 +1,101 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import xfcp.node
+
+import xfcp_model
+
+
+def make_lazy():
+    dev = xfcp_model.make_device()
+    intf = xfcp_model.LoopbackInterface(dev, window=4)
+    root = intf.enumerate(lazy=True)
+    return dev, root
+
+
+def paths(dev):
+    return [pkt.path for pkt in dev.requests]
+
+
+def test_lazy_root():
+    dev, root = make_lazy()
+
+    # only the root is identified, port count comes from its ID
+    assert paths(dev) == [()]
+    assert len(root) == 2
+    assert paths(dev) == [()]
+
+
+def test_lazy_probe():
+    dev, root = make_lazy()
+    dev.requests.clear()
+
+    # one probe for the port accessed
+    sw = root[1]
+    assert isinstance(sw, xfcp.node.SwitchNode)
+    assert paths(dev) == [(1,)]
+    assert len(sw) == 3
+    assert root[1] is sw
+    assert paths(dev) == [(1,)]
+
+    dev.requests.clear()
+    assert sw[2].name == 'RAM3'
+    assert paths(dev) == [(1, 2)]
+
+    # slices and children probe only the ports still missing
+    dev.requests.clear()
+    assert [n.name for n in sw[0:2]] == ['RAM1', 'RAM2']
+    assert sorted(paths(dev)) == [(1, 0), (1, 1)]
+
+    dev.requests.clear()
+    assert [n.name for n in root.children] == ['RAM0', 'Sub switch']
+    assert paths(dev) == [(0,)]
+
+    dev.requests.clear()
+    root.children
+    sw.children
+    root[0]
+    assert paths(dev) == []
+
+
+def test_lazy_children():
+    dev, root = make_lazy()
+    dev.requests.clear()
+
+    # a full walk identifies every node exactly once
+    names = [n.name for n in root.find_by_type(xfcp.node.MemoryNode)]
+    assert names == ['RAM0', 'RAM1', 'RAM2', 'RAM3']
+    assert sorted(paths(dev)) == [(0,), (1,), (1, 0), (1, 1), (1, 2)]
+
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_lazy_root()
+    test_lazy_probe()
+    test_lazy_children()
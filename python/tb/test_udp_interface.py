@@ -0,0 +1,173 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import xfcp.interface
+import xfcp.packet
+
+import xfcp_model
+
+
+def start(delay=0.0, drop=None, timeout=2, window=1):
+    model = xfcp_model.UDPDeviceModel(xfcp_model.make_device(), delay=delay, drop=drop)
+    intf = xfcp.interface.UDPInterface('127.0.0.1', model.port, timeout=timeout, window=window)
+    return model, intf
+
+
+def stop(model, intf):
+    intf.close()
+    model.close()
+
+
+def test_rto_update():
+    model, intf = start(delay=0.02)
+
+    try:
+        assert intf.srtt is None and intf.rto == intf.initial_rto
+
+        # first sample: SRTT = R, RTTVAR = R/2
+        start_time = time.monotonic()
+        intf.transact(xfcp.packet.IDRequestPacket())
+        rtt = time.monotonic()-start_time
+        assert 0.02 <= intf.srtt <= rtt
+        assert intf.rttvar == intf.srtt/2
+        assert intf.rto == intf.srtt+4*intf.rttvar
+
+        # later samples, RFC 6298 section 2.3
+        intf.srtt, intf.rttvar = 0.1, 0.05
+        intf.update_rtt(0.2)
+        assert abs(intf.rttvar-0.0625) < 1e-9
+        assert abs(intf.srtt-0.1125) < 1e-9
+        assert abs(intf.rto-0.3625) < 1e-9
+
+        # clamped to min_rto and max_rto
+        intf.srtt, intf.rttvar = 0.0001, 0.0
+        intf.update_rtt(0.0001)
+        assert intf.rto == intf.min_rto
+        intf.update_rtt(10.0)
+        assert intf.rto == intf.max_rto
+    finally:
+        stop(model, intf)
+
+
+def test_karn():
+    # first copy lost, the retransmit is answered
+    model, intf = start(drop=lambda n, data: n == 0)
+
+    try:
+        intf.rto = 0.02
+        intf.transact(xfcp.packet.IDRequestPacket())
+        assert intf.retransmits == 1
+        assert model.received == 2
+        # ambiguous, no sample taken
+        assert intf.srtt is None
+        assert intf.rto == 0.02
+    finally:
+        stop(model, intf)
+
+    # response slower than the RTO, the first copy is answered first
+    model, intf = start(delay=0.1)
+
+    try:
+        intf.rto = 0.03
+        intf.transact(xfcp.packet.IDRequestPacket())
+        assert intf.retransmits >= 1
+        assert intf.srtt is None
+
+        # the second response is discarded, not matched to a new request
+        time.sleep(0.3)
+        intf.transact(xfcp.packet.IDRequestPacket())
+        assert intf.stale_responses >= 1
+    finally:
+        stop(model, intf)
+
+
+def test_retransmit_filter():
+    model, intf = start(timeout=0.3)
+
+    try:
+        n = intf.enumerate()[0]
+        intf.rto = 0.02
+
+        # reads are resent
+        base = model.received
+        model.drop = lambda k, data: k == base
+        assert n.read(0, 4) == bytes(4)
+        assert intf.retransmits == 1
+        assert model.received == base+2
+
+        # writes and I2C requests are not
+        for pkt in [n.build_write(0, b'abcd'), xfcp.packet.Packet(b'\x40', (0,), (), 0x2c)]:
+            model.drop = lambda k, data: True
+            base = model.received
+            try:
+                intf.transact(pkt)
+                assert False, "lost request completed"
+            except TimeoutError:
+                pass
+            time.sleep(0.05)
+            assert intf.retransmits == 1
+            assert model.received == base+1
+    finally:
+        stop(model, intf)
+
+
+def test_deadline():
+    model, intf = start(drop=lambda n, data: True, timeout=0.5, window=2)
+
+    try:
+        intf.rto = 0.02
+
+        # each request has its own deadline, retransmits do not extend it
+        start_time = time.monotonic()
+        tr1 = intf.submit(xfcp.packet.IDRequestPacket())
+        time.sleep(0.2)
+        tr2 = intf.submit(xfcp.packet.IDRequestPacket(path=(0,)))
+
+        for tr, deadline in [(tr1, 0.5), (tr2, 0.7)]:
+            try:
+                tr.result()
+                assert False, "lost request completed"
+            except TimeoutError:
+                pass
+            dt = time.monotonic()-start_time
+            assert deadline <= dt < deadline+0.15
+
+        assert intf.retransmits > 2
+        assert not intf.pending
+    finally:
+        stop(model, intf)
+
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_rto_update()
+    test_karn()
+    test_retransmit_filter()
+    test_deadline()
@@ -0,0 +1,116 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import xfcp.batch
+
+import xfcp_ctrl
+import xfcp_model
+
+
+class RecordingBatch(xfcp.batch.Batch):
+    # ops in each non-empty flush
+    flushes = []
+
+    def flush(self):
+        if self.ops:
+            RecordingBatch.flushes.append(len(self.ops))
+        super().flush()
+
+
+def run(script, device=None):
+    dev = device or xfcp_model.make_device()
+    intf = xfcp_model.LoopbackInterface(dev, window=8)
+    n = intf.enumerate()
+
+    RecordingBatch.flushes = []
+    batch = xfcp_ctrl.Batch
+    xfcp_ctrl.Batch = RecordingBatch
+    out = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out):
+            xfcp_ctrl.run_script(n, io.StringIO(script))
+    finally:
+        xfcp_ctrl.Batch = batch
+
+    return [json.loads(line) for line in out.getvalue().splitlines()], RecordingBatch.flushes
+
+
+def test_script_read_after_write():
+    records, flushes = run(
+        "write 0 0x0 01020304\n"
+        "read 0 0x0 4\n"
+        "read 0 0x2 4\n")
+
+    assert records[1]['data'] == '01020304'
+    assert records[2]['data'] == '03040000'
+    # the reads wait for the write, then go out together
+    assert flushes == [1, 2]
+
+
+def test_script_batching():
+    records, flushes = run(
+        "read 0 0x0 4\n"
+        "read 0 0x10 4\n"
+        "write 0 0x20 aabbccdd\n"
+        "read 1.0 0x0 4   # other node, same address\n"
+        "write 1.1 0x0 11\n"
+        "read 0 0x0 4\n")
+
+    # nothing overlaps a write, one batch
+    assert flushes == [6]
+    assert [r['line'] for r in records] == [1, 2, 3, 4, 5, 6]
+    assert records[2]['count'] == 4
+    assert records[4]['count'] == 1
+
+
+def test_script_write_after_read():
+    dev = xfcp_model.make_device()
+    dev.root.children[0].mem[0:4] = b'\x11\x22\x33\x44'
+
+    records, flushes = run(
+        "read 0 0x0 4\n"
+        "write 0 0x3 55\n"
+        "read 0 0x0 4\n"
+        "bogus 0\n", dev)
+
+    assert records[0]['data'] == '11223344'
+    assert records[1]['count'] == 1
+    assert records[2]['data'] == '11223355'
+    assert 'error' in records[3]
+    assert flushes == [1, 1, 1]
+
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_script_read_after_write()
+    test_script_batching()
+    test_script_write_after_read()
@@ -0,0 +1,205 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import queue
+import socket
+import struct
+import threading
+import time
+
+import xfcp.interface
+import xfcp.packet
+
+
+def id_payload(ntype, name, ext=b''):
+    payload = bytearray(32)
+    struct.pack_into('<H', payload, 0, ntype)
+    payload[2:2+len(ext)] = ext
+    payload[16:16+len(name)] = name.encode('utf-8')
+    return bytes(payload)
+
+
+class MemoryModel(object):
+    def __init__(self, name='RAM', size=65536, addr_width=16, data_width=32, word_size=8, count_width=16, ntype=0x8001):
+        self.mem = bytearray(size)
+        self.name = name
+        self.ntype = ntype
+        self.addr_width = addr_width
+        self.count_width = count_width
+        self.byte_addr_width = addr_width + ((word_size-1)//8).bit_length()
+        self.id = id_payload(ntype, name, struct.pack('<HHHH', addr_width, data_width, word_size, count_width))
+        self.children = []
+        self.reads = 0
+        self.writes = 0
+
+    def handle(self, ptype, payload):
+        if ptype == 0xfe:
+            return 0xff, self.id
+
+        aw = (self.byte_addr_width+7)//8
+        cw = (self.count_width+7)//8
+        addr = int.from_bytes(payload[:aw], 'little')
+        count = int.from_bytes(payload[aw:aw+cw], 'little')
+
+        if ptype == 0x10:
+            self.reads += 1
+            return 0x11, payload[:aw+cw]+bytes(self.mem[addr:addr+count])
+        if ptype == 0x12:
+            self.writes += 1
+            data = payload[aw+cw:]
+            self.mem[addr:addr+len(data)] = data
+            return 0x13, payload[:aw]+len(data).to_bytes(cw, 'little')
+        return None
+
+
+class SwitchModel(object):
+    def __init__(self, children, name='XFCP Switch'):
+        self.name = name
+        self.children = children
+        self.id = id_payload(0x0100, name, struct.pack('BB', 1, len(children)))
+
+    def handle(self, ptype, payload):
+        if ptype == 0xfe:
+            return 0xff, self.id
+        return None
+
+
+class DeviceModel(object):
+    """
+    XFCP device model, routes request packets to a tree of modules
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.requests = []
+
+    def process(self, data):
+        pkt = xfcp.packet.parse(data)
+        self.requests.append(pkt)
+
+        n = self.root
+        for p in pkt.path:
+            if p >= len(n.children):
+                return None
+            n = n.children[p]
+
+        resp = n.handle(pkt.ptype, bytes(pkt.payload))
+        if resp is None:
+            return None
+
+        return xfcp.packet.Packet(resp[1], pkt.path, pkt.rpath, resp[0]).build()
+
+
+def make_device(data_width=32):
+    """
+    Two level tree: RAM0 on port 0, a switch with RAM1-RAM3 on port 1
+    """
+    return DeviceModel(SwitchModel([
+        MemoryModel('RAM0', data_width=data_width),
+        SwitchModel([MemoryModel('RAM%d' % k, data_width=data_width) for k in range(1, 4)], 'Sub switch')
+    ]))
+
+
+def make_channel(ntype=0x8A83, window=4):
+    """
+    Transceiver channel DRP behind a switch, returns the node and the model
+    """
+    drp = MemoryModel('CH0', size=0x20000, addr_width=16, data_width=16, word_size=8, ntype=ntype)
+    intf = LoopbackInterface(DeviceModel(SwitchModel([drp])), window=window)
+    return intf.enumerate()[0], drp
+
+
+class LoopbackInterface(xfcp.interface.Interface):
+    """
+    Interface to an in-process device model
+    """
+
+    def __init__(self, device, window=1, max_packet_size=None):
+        super().__init__(window, max_packet_size)
+        self.device = device
+        self.rx_queue = queue.Queue()
+
+    def cache_key(self):
+        return 'loopback:%x' % id(self.device)
+
+    def send(self, pkt):
+        resp = self.device.process(pkt.build())
+        if resp is not None:
+            self.rx_queue.put(resp)
+
+    def receive(self):
+        try:
+            return xfcp.packet.parse(self.rx_queue.get_nowait())
+        except queue.Empty:
+            raise TimeoutError("Timed out waiting for response")
+
+
+class UDPDeviceModel(threading.Thread):
+    """
+    Device model behind a UDP socket on localhost
+    """
+
+    def __init__(self, device, max_packet_size=1472, delay=0.0, drop=None):
+        super().__init__(daemon=True)
+        self.device = device
+        self.max_packet_size = max_packet_size
+        self.delay = delay
+        # drop(n, data) returns True to lose the nth datagram received
+        self.drop = drop
+        self.received = 0
+        self.oversize = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.start()
+
+    def run(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(65536)
+            except OSError:
+                return
+            n = self.received
+            self.received += 1
+            if self.drop is not None and self.drop(n, data):
+                continue
+            if len(data) > self.max_packet_size:
+                self.oversize += 1
+                continue
+            resp = self.device.process(data)
+            if resp is None:
+                continue
+            if len(resp) > self.max_packet_size:
+                # would not fit in one frame on the wire
+                self.oversize += 1
+                continue
+            if self.delay:
+                time.sleep(self.delay)
+            try:
+                self.sock.sendto(resp, addr)
+            except OSError:
+                return
+
+    def close(self):
+        self.sock.close()
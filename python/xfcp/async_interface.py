@@ -0,0 +1,210 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import asyncio
+
+try:
+    import serial_asyncio
+except ImportError:
+    serial_asyncio = None
+
+from . import packet
+from . import node
+from .interface import Interface, Transaction, cobs_encode, cobs_decode
+
+
+class AsyncTransaction(Transaction):
+    def __init__(self, interface, pkt, callback=None):
+        super().__init__(interface, pkt, callback)
+        self.future = asyncio.get_running_loop().create_future()
+
+    def set_response(self, pkt):
+        super().set_response(pkt)
+        self.resolve()
+
+    def set_exception(self, ex):
+        super().set_exception(ex)
+        self.resolve()
+
+    def resolve(self):
+        if self.future.done():
+            return
+        if self.exception is not None:
+            self.future.set_exception(self.exception)
+        else:
+            self.future.set_result(self.value)
+
+    def __await__(self):
+        return self.future.__await__()
+
+
+class AsyncInterface(Interface):
+    """
+    Event loop counterpart of Interface
+
+    Responses are dispatched from the transport callbacks, so submit,
+    transact, flush and enumerate are coroutines and nodes are driven with
+    their *_async methods.
+    """
+
+    def __init__(self, timeout=10, window=1, max_packet_size=None):
+        super().__init__(window, max_packet_size)
+
+        self.timeout = timeout
+
+    async def open(self):
+        raise NotImplementedError()
+
+    def close(self):
+        raise NotImplementedError()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def submit(self, pkt, callback=None):
+        while len(self.pending) >= max(self.window, 1):
+            await asyncio.wait([tr.future for tr in self.pending.values()], return_when=asyncio.FIRST_COMPLETED)
+
+        return self.issue(AsyncTransaction(self, pkt, callback))
+
+    async def transact(self, pkt, callback=None):
+        tr = await self.submit(pkt, callback)
+        try:
+            return await asyncio.wait_for(tr.future, self.timeout)
+        except asyncio.TimeoutError:
+            self.cancel(tr)
+            raise
+
+    def poll(self):
+        raise NotImplementedError()
+
+    async def flush(self):
+        await asyncio.gather(*(tr.future for tr in list(self.pending.values())))
+
+    def fail_pending(self, ex):
+        for tr in list(self.pending.values()):
+            self.cancel(tr)
+            tr.set_exception(ex)
+
+    async def enumerate(self):
+        self._root = await node.enumerate_interface_async(self)
+        return self._root
+
+    async def get_root(self):
+        if self._root is None:
+            await self.enumerate()
+        return self._root
+
+
+class AsyncSerialInterface(AsyncInterface):
+    def __init__(self, port='/dev/ttyUSB0', baud=115200, timeout=10, window=1):
+        super().__init__(timeout, window)
+
+        self.port = port
+        self.baud = baud
+        self.reader = None
+        self.writer = None
+        self.rx_task = None
+
+    async def open(self):
+        if serial_asyncio is None:
+            raise Exception("AsyncSerialInterface requires pyserial-asyncio")
+
+        self.reader, self.writer = await serial_asyncio.open_serial_connection(url=self.port, baudrate=self.baud)
+        self.rx_task = asyncio.get_running_loop().create_task(self.run_rx())
+        return self
+
+    def close(self):
+        if self.rx_task is not None:
+            self.rx_task.cancel()
+            self.rx_task = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    async def run_rx(self):
+        try:
+            while True:
+                frame = await self.reader.readuntil(b'\x00')
+                data = cobs_decode(frame[:-1])
+                if not data:
+                    # framing error or empty frame
+                    continue
+                try:
+                    pkt = packet.parse(data)
+                except Exception:
+                    continue
+                self.dispatch(pkt)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            self.fail_pending(ex)
+
+    def send(self, pkt):
+        self.writer.write(cobs_encode(pkt.build())+b'\x00')
+
+
+class AsyncUDPInterface(AsyncInterface):
+    class Protocol(asyncio.DatagramProtocol):
+        def __init__(self, interface):
+            self.interface = interface
+
+        def datagram_received(self, data, addr):
+            try:
+                pkt = packet.parse(data)
+            except Exception:
+                return
+            self.interface.dispatch(pkt)
+
+        def error_received(self, exc):
+            self.interface.fail_pending(exc)
+
+    def __init__(self, host, port=14000, timeout=10, window=1, mtu=1500):
+        # IPv4 and UDP headers
+        super().__init__(timeout, window, mtu-28)
+
+        if ':' in host:
+            host, port = host.rsplit(':', 2)
+            port = int(port)
+
+        self.host = host
+        self.port = port
+        self.transport = None
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        self.transport, protocol = await loop.create_datagram_endpoint(
+            lambda: self.Protocol(self), remote_addr=(self.host, self.port))
+        return self
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def send(self, pkt):
+        self.transport.sendto(pkt.build())
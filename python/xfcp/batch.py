@@ -0,0 +1,311 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+from . import packet
+
+
+class BatchOp(object):
+    def __init__(self, batch, node, build, parse):
+        self.batch = batch
+        self.node = node
+        self.build = build
+        self.parse = parse
+        self.value = None
+        self.exception = None
+        self.complete = False
+
+    def done(self):
+        return self.complete
+
+    def set_result(self, value):
+        self.value = value
+        self.complete = True
+
+    def set_exception(self, ex):
+        self.exception = ex
+        self.complete = True
+
+    def result(self):
+        if not self.complete:
+            self.batch.flush()
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+
+class MaskedWriteOp(BatchOp):
+    def __init__(self, batch, node, addr, mask, val, ws):
+        super().__init__(batch, node, None, lambda pkt: node.parse_write(pkt)//ws)
+        self.addr = addr
+        self.mask = mask
+        self.val = val
+        self.ws = ws
+        self.read_tr = None
+        self.base = None
+
+
+class SplitOp(BatchOp):
+    def __init__(self, batch, node, parts, combine):
+        super().__init__(batch, node, None, None)
+        self.parts = parts
+        self.combine = combine
+
+
+class Batch(object):
+    """
+    Collects operations against one or more nodes on an interface
+
+    Nothing is sent until flush() (or the end of a with block), at which
+    point all operations go out back to back, limited only by the
+    interface window (or the window passed here, which applies to every
+    interface the operations touch), and each returned op resolves like a
+    future.  Reads and writes larger than one packet are split into
+    several requests and resolve once all of them complete.  Masked writes fetch their current values in
+    a first pass and then see the effect of earlier writes in the same
+    batch, so they behave as if issued in order.
+    """
+
+    def __init__(self, interface, node=None, window=None):
+        self.interface = interface
+        self.node = node
+        self.window = window
+        self.ops = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.ops = []
+
+    def __len__(self):
+        return len(self.ops)
+
+    def add(self, node, build, parse=None):
+        op = BatchOp(self, node if node is not None else self.node, build, parse)
+        self.ops.append(op)
+        return op
+
+    def submit(self, pkt, callback=None):
+        return self.add(None, lambda: pkt, callback)
+
+    def add_split(self, node, parts, combine):
+        op = SplitOp(self, node, parts, combine)
+        self.ops.append(op)
+        return op
+
+    def add_read(self, node, addr, count, convert=None):
+        chunks = node.split(addr, count)
+        if len(chunks) <= 1:
+            if convert is None:
+                return self.add(node, lambda: node.build_read(addr, count), node.parse_read)
+            return self.add(node, lambda: node.build_read(addr, count), lambda pkt: convert(node.parse_read(pkt)))
+
+        parts = [BatchOp(self, node, (lambda a=a, c=c: node.build_read(a, c)), node.parse_read) for a, c in chunks]
+
+        def combine(lst):
+            for d, (a, c) in zip(lst, chunks):
+                if len(d) != c:
+                    raise Exception("Short read at address 0x%x (%d of %d bytes)" % (a, len(d), c))
+            data = b''.join(lst)
+            return convert(data) if convert is not None else data
+
+        return self.add_split(node, parts, combine)
+
+    def add_write(self, node, addr, data, convert=None):
+        chunks = node.split(addr, len(data))
+        if len(chunks) <= 1:
+            if convert is None:
+                return self.add(node, lambda: node.build_write(addr, data), node.parse_write)
+            return self.add(node, lambda: node.build_write(addr, data), lambda pkt: convert(node.parse_write(pkt)))
+
+        data = memoryview(data)
+        parts = [BatchOp(self, node, (lambda a=a, c=c: node.build_write(a, data[a-addr:a-addr+c])), node.parse_write) for a, c in chunks]
+        return self.add_split(node, parts, lambda lst: convert(sum(lst)) if convert is not None else sum(lst))
+
+    # memory access
+    def read(self, addr, count, node=None):
+        node = node if node is not None else self.node
+        return self.add_read(node, addr, count)
+
+    def read_words(self, addr, count, ws=2, node=None):
+        node = node if node is not None else self.node
+        return self.add_read(node, addr, count*ws,
+            lambda data: [int.from_bytes(d, 'little') for d in chunked(data, ws)])
+
+    def read_dwords(self, addr, count, node=None):
+        return self.read_words(addr, count, 4, node)
+
+    def read_word(self, addr, ws=2, node=None):
+        node = node if node is not None else self.node
+        return self.add(node, lambda: node.build_read(addr, ws),
+            lambda pkt: int.from_bytes(node.parse_read(pkt), 'little'))
+
+    def read_dword(self, addr, node=None):
+        return self.read_word(addr, 4, node)
+
+    def write(self, addr, data, node=None):
+        node = node if node is not None else self.node
+        if not isinstance(data, (bytes, bytearray)):
+            data = bytes(data)
+        return self.add_write(node, addr, data)
+
+    def write_words(self, addr, data, ws=2, node=None):
+        node = node if node is not None else self.node
+        data = b''.join(w.to_bytes(ws, 'little') for w in data)
+        return self.add_write(node, addr, data, lambda n: n//ws)
+
+    def write_dwords(self, addr, data, node=None):
+        return self.write_words(addr, data, 4, node)
+
+    def write_word(self, addr, data, ws=2, node=None):
+        return self.write_words(addr, [data], ws, node)
+
+    def write_dword(self, addr, data, node=None):
+        return self.write_words(addr, [data], 4, node)
+
+    def masked_write(self, addr, mask, val, ws=2, node=None):
+        op = MaskedWriteOp(self, node if node is not None else self.node, addr, mask, val, ws)
+        self.ops.append(op)
+        return op
+
+    # I2C
+    def read_i2c(self, addr, count, node=None):
+        node = node if node is not None else self.node
+        return self.add(node, lambda: node.build_read_i2c(addr, count), node.parse_read_i2c)
+
+    def write_i2c(self, addr, data, node=None):
+        node = node if node is not None else self.node
+        return self.add(node, lambda: node.build_write_i2c(addr, data), node.parse_write_i2c)
+
+    def write_read_i2c(self, addr, data, count, node=None):
+        node = node if node is not None else self.node
+        return self.add(node, lambda: node.build_write_read_i2c(addr, data, count), node.parse_write_read_i2c)
+
+    def get_i2c_status(self, node=None):
+        node = node if node is not None else self.node
+        return self.add(node, node.build_get_i2c_status, node.parse_get_i2c_status)
+
+    def flush(self):
+        ops = self.ops
+        self.ops = []
+
+        if not ops:
+            return
+
+        # the batch window applies to every interface involved
+        saved = []
+        if self.window is not None:
+            for op in [None]+ops:
+                intf = self.get_interface(op) if op is not None else self.interface
+                if intf is not None and all(intf is not i for i, w in saved):
+                    saved.append((intf, intf.window))
+                    intf.window = self.window
+
+        try:
+            self.run(ops)
+        finally:
+            for intf, window in saved:
+                intf.window = window
+
+    def get_interface(self, op):
+        # ops may target nodes on other interfaces (e.g. in an InterfacePool)
+        if op.node is not None:
+            return op.node.interface
+        return self.interface
+
+    def run(self, ops):
+        split = [op for op in ops if isinstance(op, SplitOp)]
+        if split:
+            ops = [part for op in ops for part in (op.parts if isinstance(op, SplitOp) else [op])]
+
+        masked = [op for op in ops if isinstance(op, MaskedWriteOp)]
+
+        # first pass: current values for masked writes
+        tracked = set()
+        for op in masked:
+            op.read_tr = self.get_interface(op).submit(op.node.build_read(op.addr, op.ws), op.node.parse_read)
+            tracked.update((tuple(op.node.path), op.addr+k) for k in range(op.ws))
+
+        for op in masked:
+            try:
+                op.base = bytearray(op.read_tr.result())
+            except Exception as ex:
+                op.set_exception(ex)
+
+        # second pass: everything, in order
+        shadow = {}
+        trs = []
+        for op in ops:
+            if op.complete:
+                continue
+
+            try:
+                if isinstance(op, MaskedWriteOp):
+                    path = tuple(op.node.path)
+                    base = op.base
+                    for k in range(op.ws):
+                        base[k] = shadow.get((path, op.addr+k), base[k])
+                    val = (int.from_bytes(base, 'little') & ~op.mask) | (op.val & op.mask)
+                    pkt = op.node.build_write(op.addr, val.to_bytes(op.ws, 'little'))
+                else:
+                    pkt = op.build()
+
+                if tracked and isinstance(pkt, packet.WriteRequestPacket):
+                    path = tuple(pkt.path)
+                    for k, b in enumerate(pkt.data):
+                        if (path, pkt.addr+k) in tracked:
+                            shadow[(path, pkt.addr+k)] = b
+
+                trs.append((op, pkt, self.get_interface(op).submit(pkt, op.parse)))
+            except Exception as ex:
+                op.set_exception(ex)
+
+        for op, pkt, tr in trs:
+            try:
+                op.set_result(tr.result())
+            except Exception as ex:
+                op.set_exception(ex)
+                continue
+
+            # let the node track completed writes (e.g. DRP shadow cache)
+            if (op.node is not None and isinstance(pkt, packet.WriteRequestPacket) and
+                    tuple(pkt.path) == tuple(op.node.path)):
+                op.node.write_done(pkt.addr, pkt.data)
+
+        for op in split:
+            ex = next((part.exception for part in op.parts if part.exception is not None), None)
+            if ex is not None:
+                op.set_exception(ex)
+                continue
+            try:
+                op.set_result(op.combine([part.value for part in op.parts]))
+            except Exception as ex:
+                op.set_exception(ex)
+
+
+def chunked(data, size):
+    return [data[k:k+size] for k in range(0, len(data), size)]
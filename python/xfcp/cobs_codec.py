@@ -0,0 +1,161 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import re
+
+try:
+    from cobs import cobs as _cobs
+except ImportError:
+    _cobs = None
+
+
+# runs of zero bytes in raw data and of empty (0x01) groups in encoded data
+_zero_run = re.compile(b'\x00+')
+_empty_run = re.compile(b'\x01+')
+_code_bytes = [bytes([k+1]) for k in range(255)]
+
+
+def cobs_encode(block):
+    if _cobs is not None:
+        return _cobs.encode(bytes(block))
+
+    if not isinstance(block, (bytes, bytearray)):
+        block = bytes(block)
+
+    # pick a strategy based on how the zeros are distributed: scanning run
+    # by run is fastest when most zeros sit in long runs (blank memory),
+    # splitting on every zero is fastest otherwise
+    head = block[:4096]
+    if head.count(b'\x00'*8)*16 >= head.count(0):
+        return _cobs_encode_runs(block)
+    return _cobs_encode_split(block)
+
+
+def _cobs_encode_runs(block):
+    mv = memoryview(block)
+    n = len(block)
+    enc = bytearray()
+
+    start = 0
+
+    while True:
+        end = block.find(0, start)
+        last = end < 0
+        if last:
+            end = n
+
+        seg = start
+        while end - start >= 254:
+            enc.append(255)
+            enc += mv[start:start+254]
+            start += 254
+
+        if last:
+            # no trailing group when the data ends on a full block
+            if start < end or seg == end:
+                enc.append(end-start+1)
+                enc += mv[start:end]
+            break
+
+        enc.append(end-start+1)
+        enc += mv[start:end]
+
+        # each further zero in a run is an empty group
+        start = _zero_run.match(block, end).end()
+        if start-end > 1:
+            enc += b'\x01'*(start-end-1)
+
+    return bytes(enc)
+
+
+def _cobs_encode_split(block):
+    segs = block.split(b'\x00')
+
+    if max(map(len, segs)) < 254:
+        parts = [None]*(2*len(segs))
+        parts[0::2] = map(_code_bytes.__getitem__, map(len, segs))
+        parts[1::2] = segs
+        return b''.join(parts)
+
+    parts = []
+    last = len(segs)-1
+
+    for k, seg in enumerate(segs):
+        n = len(seg)
+        start = 0
+        while n - start >= 254:
+            parts.append(b'\xff')
+            parts.append(seg[start:start+254])
+            start += 254
+        if k == last and n > 0 and start == n:
+            # no trailing group when the data ends on a full block
+            break
+        parts.append(_code_bytes[n-start])
+        parts.append(seg[start:])
+
+    return b''.join(parts)
+
+
+def cobs_decode(block):
+    if not isinstance(block, (bytes, bytearray)):
+        block = bytes(block)
+
+    if 0 in block:
+        return None
+
+    if _cobs is not None:
+        try:
+            return _cobs.decode(block)
+        except _cobs.DecodeError:
+            return None
+
+    mv = memoryview(block)
+    n = len(block)
+    dec = bytearray()
+
+    i = 0
+
+    while i < n:
+        code = block[i]
+
+        if code == 1:
+            # run of empty groups, one zero each except at the very end
+            j = _empty_run.match(block, i).end()
+            run = j-i
+            if j >= n:
+                run -= 1
+            if run > 0:
+                dec += b'\x00'*run
+            i = j
+            continue
+
+        j = i+code
+        if j > n:
+            return None
+        dec += mv[i+1:j]
+        i = j
+        if code < 255 and i < n:
+            dec.append(0)
+
+    return bytes(dec)
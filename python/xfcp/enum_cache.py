@@ -0,0 +1,165 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import json
+import os
+import random
+
+from . import packet
+from . import node
+
+
+def default_filename():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'xfcp', 'enum_cache.json')
+
+
+class EnumerationCache(object):
+    """
+    On-disk cache of enumeration results
+
+    Stores the ID response payload of every node, keyed by the interface
+    endpoint and the root node ID.  Before a cached tree is used, the
+    switches are identified again one level at a time, so a replaced switch
+    is caught before its stale subtree is addressed, along with a few other
+    nodes picked at random.  On a mismatch the interface is enumerated again
+    and the entry replaced.
+    """
+
+    version = 1
+
+    def __init__(self, filename=None, spot_checks=2):
+        self.filename = filename or default_filename()
+        self.spot_checks = spot_checks
+        self.entries = None
+
+    def load(self):
+        self.entries = {}
+        try:
+            with open(self.filename, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get('version') == self.version:
+            self.entries = data.get('entries', {})
+
+    def save(self):
+        d = os.path.dirname(self.filename)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        tmp = self.filename+'.%d.tmp' % os.getpid()
+        with open(tmp, 'w') as f:
+            json.dump({'version': self.version, 'entries': self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.filename)
+
+    def get_ids(self, key, root_payload):
+        if self.entries is None:
+            self.load()
+
+        entry = self.entries.get(key)
+        if entry is None or entry.get('root') != root_payload.hex():
+            return None
+
+        try:
+            return {path_from_str(p): packet.IDResponsePacket(bytes.fromhex(h), path=path_from_str(p))
+                for p, h in entry['ids'].items()}
+        except (KeyError, ValueError, AttributeError):
+            return None
+
+    def put_ids(self, key, ids):
+        if self.entries is None:
+            self.load()
+
+        self.entries[key] = {
+            'root': ids[()].payload.hex(),
+            'ids': {path_to_str(p): bytes(pkt.payload).hex() for p, pkt in ids.items()}
+        }
+        self.save()
+
+    def invalidate(self, interface):
+        key = interface.cache_key()
+        if self.entries is None:
+            self.load()
+        if self.entries.pop(key, None) is not None:
+            self.save()
+
+    def check(self, interface, ids, paths):
+        if not paths:
+            return True
+        try:
+            resp = node.identify(interface, paths)
+        except TimeoutError:
+            return False
+        return all(bytes(resp[p].payload) == bytes(ids[p].payload) for p in paths)
+
+    def stages(self, ids):
+        # paths to re-identify, in order: the switches one level at a time,
+        # so every switch at a level is known good before the next level
+        # is addressed, then the spot checks (the root was matched by
+        # get_ids)
+        switches = [p for p, pkt in ids.items() if p and node.child_paths(p, pkt)]
+        depth = max((len(p) for p in switches), default=0)
+        stages = [[p for p in switches if len(p) == k] for k in range(1, depth+1)]
+
+        others = [p for p in ids if p and p not in switches]
+        stages.append(random.sample(others, min(self.spot_checks, len(others))))
+        return stages
+
+    def validate(self, interface, ids):
+        return all(self.check(interface, ids, paths) for paths in self.stages(ids))
+
+    def enumerate(self, interface, lazy=False):
+        key = interface.cache_key()
+        if key is None:
+            return interface.enumerate(lazy=lazy)
+
+        root_pkt = interface.transact(packet.IDRequestPacket(path=()))
+
+        ids = self.get_ids(key, root_pkt.payload)
+        if ids is not None and not self.validate(interface, ids):
+            ids = None
+
+        if lazy:
+            # switch ports are probed when accessed, from the cached IDs
+            # where there are any
+            if ids is None:
+                self.invalidate(interface)
+                ids = {(): root_pkt}
+            root = node.enumerate_interface(interface, ids=ids, lazy=True)
+        elif ids is not None:
+            root = node.enumerate_interface(interface, ids=ids)
+        else:
+            root = node.enumerate_interface(interface, ids=node.identify_tree(interface, (), {(): root_pkt}))
+            self.put_ids(key, node.collect_ids(root))
+
+        interface._root = root
+        return root
+
+
+def path_to_str(path):
+    return '.'.join(str(x) for x in path)
+
+
+def path_from_str(s):
+    return tuple(int(x) for x in s.split('.')) if s else ()
@@ -0,0 +1,500 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import datetime
+import math
+import time
+
+from . import gty_node
+from .batch import Batch
+
+
+class GridScan(object):
+    """
+    Every point of the horz/vert grid, both UT signs at each point
+    """
+
+    def __init__(self, ch):
+        self.ch = ch
+        self.points = self.generate()
+
+    def generate(self):
+        ch = self.ch
+        for horz in range(ch.horz_start, ch.horz_stop+1, ch.horz_step):
+            for vert in range(ch.vert_start, ch.vert_stop+1, ch.vert_step):
+                for ut_sign in (0, 1):
+                    yield (horz, vert, ut_sign, ch.prescale)
+
+    def next_point(self):
+        # (horz, vert, ut_sign, prescale), or None when done
+        return next(self.points, None)
+
+    def report(self, point, bit_count, error_count):
+        # returns True if the measurement should be recorded
+        return True
+
+
+class ContourScan(GridScan):
+    """
+    Locates the eye boundary instead of visiting every grid point
+
+    Each row (vert offset and UT sign) is checked at the horizontal center
+    first, then the edges on both sides are found by bisection on the
+    grid, so only about log2 of the row width is measured per side.  A
+    point is closed when its BER is above ber_threshold.  Measurements
+    start at min_prescale and only points with too few errors to decide
+    are repeated at a higher prescale (up to the channel prescale), so
+    long dwells are spent near the contour.  Points that are never
+    measured are left out of the data.
+    """
+
+    def __init__(self, ch, ber_threshold=1e-6, min_prescale=0, min_errors=3):
+        self.ber_threshold = ber_threshold
+        self.min_prescale = min(min_prescale, ch.prescale)
+        self.min_errors = min_errors
+        self.result = None
+        super().__init__(ch)
+
+    def classify(self, point, bit_count, error_count):
+        # True if closed, False if open, None if more bits are needed
+        if error_count < self.min_errors and bit_count*self.ber_threshold < self.min_errors:
+            if point[3] < self.ch.prescale:
+                return None
+        return error_count > bit_count*self.ber_threshold
+
+    def report(self, point, bit_count, error_count):
+        self.result = (self.classify(point, bit_count, error_count), bit_count)
+        return self.result[0] is not None
+
+    def measure(self, horz, vert, ut_sign):
+        prescale = self.min_prescale
+        while True:
+            yield (horz, vert, ut_sign, prescale)
+            closed, bit_count = self.result
+            if closed is not None:
+                return closed
+            # jump straight to a prescale with enough bits
+            need = self.min_errors/self.ber_threshold
+            prescale += max(1, math.ceil(math.log2(need/max(bit_count, 1))))
+            prescale = min(prescale, self.ch.prescale)
+
+    def find_edge(self, vert, ut_sign, horz):
+        # horz runs from a known open point outwards
+        if not (yield from self.measure(horz[-1], vert, ut_sign)):
+            return
+        lo = 0
+        hi = len(horz)-1
+        while hi-lo > 1:
+            mid = (lo+hi)//2
+            if (yield from self.measure(horz[mid], vert, ut_sign)):
+                hi = mid
+            else:
+                lo = mid
+
+    def generate(self):
+        ch = self.ch
+        horz = list(range(ch.horz_start, ch.horz_stop+1, ch.horz_step))
+        c = min(range(len(horz)), key=lambda k: abs(horz[k]))
+        for vert in range(ch.vert_start, ch.vert_stop+1, ch.vert_step):
+            for ut_sign in (0, 1):
+                if (yield from self.measure(horz[c], vert, ut_sign)):
+                    continue
+                if c > 0:
+                    yield from self.find_edge(vert, ut_sign, horz[c::-1])
+                if c < len(horz)-1:
+                    yield from self.find_edge(vert, ut_sign, horz[c:])
+
+
+class DwellPolicy(object):
+    """
+    Per point dwell control
+
+    The hardware counts samples until the prescaled sample count (or the
+    error counter) saturates.  A point with max_errors errors already has
+    a good enough BER estimate, so it is stopped early; a point with fewer
+    than min_errors errors is measured again at a higher prescale until
+    its BER bound reaches ber_floor or the prescale hits max_prescale.
+    """
+
+    def __init__(self, max_errors=100, ber_floor=1e-12, min_errors=3, max_prescale=31):
+        self.max_errors = max_errors
+        self.ber_floor = ber_floor
+        self.min_errors = min_errors
+        self.max_prescale = max_prescale
+
+    def stop_early(self, point, bit_count, error_count):
+        return bit_count > 0 and error_count >= self.max_errors
+
+    def next_prescale(self, point, bit_count, error_count):
+        # prescale for another measurement of the point, or None if done
+        prescale = point[3]
+        need = self.min_errors/self.ber_floor
+        if error_count >= self.min_errors or bit_count >= need or prescale >= self.max_prescale:
+            return None
+        prescale += max(1, math.ceil(math.log2(need/max(bit_count, 1))))
+        return min(prescale, self.max_prescale)
+
+
+class EyeScanChannel(object):
+    def __init__(self, xcvr):
+        self.xcvr = xcvr
+
+        self.file = None
+        self.file_name = None
+
+        self.prescale = 4
+        self.horz_start = -32
+        self.horz_stop = 32
+        self.horz_step = 4
+        self.vert_start = -32
+        self.vert_stop = 32
+        self.vert_step = 4
+        self.vs_range = 0
+
+        self.strategy = GridScan
+        self.dwell = None
+
+        self.data_width = None
+        self.int_data_width = None
+
+        self.scan = None
+        self.point = None
+        self.aligned = False
+        self.own_shadow = False
+
+        self.data = []
+        self.running = False
+        self.verbose = False
+
+    def open_file(self):
+        if not self.file_name:
+            return
+
+        self.file = open(self.file_name, 'w')
+
+        self.file.write("# eyescan\n")
+        self.file.write(f"# date: {datetime.datetime.now()}\n")
+        self.file.write("# node path: %s\n" % '.'.join(str(x) for x in self.xcvr.path))
+        self.file.write(f"# node name: {self.xcvr.name}\n")
+        if self.xcvr.ext_str:
+            self.file.write(f"# node extended ID: {self.xcvr.ext_str}\n")
+        self.file.write(f"# data width: {self.data_width}\n")
+        self.file.write(f"# int data width: {self.int_data_width}\n")
+        self.file.write(f"# ES prescale: {2**(self.prescale+1)} (raw {self.prescale})\n")
+        self.file.write("horiz_offset,vert_offset,ut_sign,bit_count,error_count\n")
+
+    def close_file(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def bit_count(self, sample_count, prescale):
+        return sample_count*2**(1+prescale)*self.int_data_width
+
+    def record(self, point, bit_count, error_count):
+        horz, vert, ut_sign, prescale = point
+
+        self.data.append((horz, vert, ut_sign, bit_count, error_count))
+
+        line = f"{horz},{vert},{ut_sign},{bit_count},{error_count}"
+
+        if self.verbose:
+            print(f"[{self.xcvr.name}] {line}")
+
+        if self.file:
+            self.file.write(f"{line}\n")
+            self.file.flush()
+
+    # register updates queued on a batch, skipped when the shadow cache
+    # says the register already holds the value
+    def set_reg(self, b, addr, mask, val):
+        xcvr = self.xcvr
+        old = xcvr.read_reg(addr)
+        new = (old & ~mask) | (val & mask)
+        if new != old:
+            if xcvr.shadow is not None:
+                xcvr.shadow[addr] = new
+            b.write_word(addr, new, node=xcvr)
+
+    def stop(self, b):
+        self.set_reg(b, self.xcvr.es_control_addr, 0xfc00, 0x0000)
+
+    def start(self, b, point):
+        horz, vert, ut_sign, prescale = point
+        self.set_reg(b, self.xcvr.es_horz_offset_addr, 0xfff0, ((horz & 0x7ff) | 0x800) << 4)
+        self.set_reg(b, self.xcvr.es_vert_addr, 0x07fc,
+            (0x0400 if vert < 0 else 0) | (0x0200 if ut_sign else 0) | (abs(vert) << 2))
+        self.set_reg(b, self.xcvr.es_control_addr, 0xfc1f, 0x0400 | prescale)
+
+
+class EyeScan(object):
+    """
+    Eye scans on many transceiver channels at once
+
+    All channels measure concurrently.  Each poll() reads the status of
+    every running channel in one batched burst, then stops, records and
+    restarts the channels that finished in a second burst, so a quad
+    takes about as long as a single channel.  Register writes are checked
+    against the DRP shadow cache, which is enabled on every channel, so
+    only registers that actually change are written; teardown() (called
+    once the scan completes) disables it again where it was off before.
+    """
+
+    def __init__(self, channels=(), poll_interval=0.01):
+        self.channels = []
+        self.poll_interval = poll_interval
+        # channels that finished a measurement in the last poll()
+        self.last_done = 0
+
+        for ch in channels:
+            self.add(ch)
+
+    @classmethod
+    def from_tree(cls, root, node_type=gty_node.GTHE3ChannelNode, **kwargs):
+        return cls(root.find_by_type(node_type), **kwargs)
+
+    def add(self, ch):
+        if not isinstance(ch, EyeScanChannel):
+            ch = EyeScanChannel(ch)
+        self.channels.append(ch)
+        return ch
+
+    def running(self):
+        return [ch for ch in self.channels if ch.running]
+
+    def batch(self, channels):
+        return Batch(channels[0].xcvr.interface)
+
+    def read_status(self, channels):
+        # error count, sample count and control status, one read each
+        b = self.batch(channels)
+        ops = [b.read_words(ch.xcvr.es_status_addr, 3, node=ch.xcvr) for ch in channels]
+        b.flush()
+        return [op.result() for op in ops]
+
+    def wait_done(self, channels, timeout=10.0):
+        deadline = time.monotonic()+timeout
+        status = {}
+        while len(status) < len(channels):
+            pending = [ch for ch in channels if ch not in status]
+            for ch, st in zip(pending, self.read_status(pending)):
+                if st[2] & 1:
+                    status[ch] = st
+            if len(status) < len(channels):
+                if time.monotonic() > deadline:
+                    names = ', '.join(ch.xcvr.name for ch in channels if ch not in status)
+                    raise TimeoutError("Timed out waiting for eye scan measurement (%s)" % names)
+                if self.poll_interval:
+                    time.sleep(self.poll_interval)
+        return status
+
+    def wait_reset_done(self, channels, timeout=3.0):
+        # returns the channels still stuck in reset
+        deadline = time.monotonic()+timeout
+        while True:
+            b = self.batch(channels)
+            ops = [b.read_word(0xfe00, node=ch.xcvr) for ch in channels]
+            b.flush()
+            pending = [ch for ch, op in zip(channels, ops) if op.result() & 0x0500 != 0x0500]
+            if not pending or time.monotonic() > deadline:
+                return pending
+            time.sleep(0.1)
+
+    def setup(self):
+        for ch in self.channels:
+            xcvr = ch.xcvr
+
+            if xcvr.shadow is None:
+                xcvr.enable_shadow()
+                ch.own_shadow = True
+
+            ch.data_width = xcvr.get_rx_data_width()
+            ch.int_data_width = xcvr.get_rx_int_data_width()
+
+            xcvr.set_es_control(0x00)
+
+            xcvr.set_es_prescale(4)
+            xcvr.set_es_errdet_en(1)
+
+            if xcvr.get_es_mask_width() == 80:
+                xcvr.set_es_sdata_mask(0xffffffffff0000000000 | (0xffffffffff >> ch.int_data_width))
+                xcvr.set_es_qual_mask(0xffffffffffffffffffff)
+            else:
+                xcvr.set_es_sdata_mask(0xffffffffffffffffffff00000000000000000000 | (0xffffffffffffffffffff >> ch.int_data_width))
+                xcvr.set_es_qual_mask(0xffffffffffffffffffffffffffffffffffffffff)
+
+            xcvr.set_rx_eyescan_vs_range(ch.vs_range)
+
+            xcvr.set_es_horz_offset(0x800)
+            xcvr.set_rx_eyescan_vs_neg_dir(0)
+            xcvr.set_rx_eyescan_vs_code(0)
+            xcvr.set_rx_eyescan_vs_ut_sign(0)
+
+            xcvr.set_es_eye_scan_en(1)
+
+            xcvr.rx_pma_reset()
+
+        # one settling delay for all channels
+        time.sleep(0.5)
+
+    def align(self, attempts=10):
+        # check for proper alignment, resetting the eye scan logic of
+        # channels that show a high BER
+        pending = list(self.channels)
+
+        for k in range(attempts):
+            for ch in self.wait_reset_done(pending):
+                print(f"[{ch.xcvr.name}] Error: channel stuck in reset")
+                pending.remove(ch)
+
+            if not pending:
+                return
+
+            time.sleep(0.1)
+
+            b = self.batch(pending)
+            for ch in pending:
+                ch.set_reg(b, ch.xcvr.es_control_addr, 0xfc00, 0x0400)
+            b.flush()
+
+            status = self.wait_done(pending)
+
+            b = self.batch(pending)
+            for ch in pending:
+                ch.stop(b)
+            b.flush()
+
+            failed = []
+            for ch in pending:
+                error_count, sample_count = status[ch][0], status[ch][1]
+                ber = error_count/max(ch.bit_count(sample_count, 4), 1)
+
+                if ber < 0.01:
+                    ch.aligned = True
+                    continue
+
+                print(f"[{ch.xcvr.name}] High BER ({ber:.02f}), resetting eye scan logic")
+
+                ch.xcvr.set_es_horz_offset(0x880)
+                ch.xcvr.set_eyescan_reset(1)
+                ch.xcvr.set_es_horz_offset(0x800)
+                ch.xcvr.set_eyescan_reset(0)
+                failed.append(ch)
+
+            pending = failed
+
+            if not pending:
+                return
+
+        for ch in pending:
+            print(f"[{ch.xcvr.name}] High BER, alignment failed")
+
+    def start(self):
+        self.setup()
+        self.align()
+
+        channels = [ch for ch in self.channels if ch.aligned]
+        if not channels:
+            return
+
+        b = self.batch(channels)
+        for ch in channels:
+            ch.open_file()
+            ch.scan = ch.strategy(ch)
+            ch.point = ch.scan.next_point()
+            if ch.point is None:
+                ch.close_file()
+                continue
+            ch.start(b, ch.point)
+            ch.running = True
+        b.flush()
+
+    def poll(self):
+        # returns False once every channel is done
+        channels = self.running()
+        if not channels:
+            self.teardown()
+            return False
+
+        done = []
+        for ch, st in zip(channels, self.read_status(channels)):
+            error_count, sample_count = st[0], st[1]
+            bit_count = ch.bit_count(sample_count, ch.point[3])
+            if st[2] & 1 or (ch.dwell and ch.dwell.stop_early(ch.point, bit_count, error_count)):
+                done.append((ch, bit_count, error_count))
+
+        self.last_done = len(done)
+        if not done:
+            return True
+
+        b = self.batch(channels)
+        for ch, bit_count, error_count in done:
+            ch.stop(b)
+
+            if ch.dwell:
+                prescale = ch.dwell.next_prescale(ch.point, bit_count, error_count)
+                if prescale is not None:
+                    # too few errors to bound the BER, dwell longer
+                    ch.point = ch.point[:3]+(prescale,)
+                    ch.start(b, ch.point)
+                    continue
+
+            if ch.scan.report(ch.point, bit_count, error_count):
+                ch.record(ch.point, bit_count, error_count)
+
+            ch.point = ch.scan.next_point()
+            if ch.point is None:
+                ch.running = False
+                ch.close_file()
+                continue
+
+            ch.start(b, ch.point)
+        b.flush()
+
+        if self.running():
+            return True
+
+        self.teardown()
+        return False
+
+    def teardown(self):
+        # close files and restore the shadow state from before setup()
+        for ch in self.channels:
+            ch.running = False
+            ch.close_file()
+            if ch.own_shadow:
+                ch.xcvr.enable_shadow(False)
+                ch.own_shadow = False
+
+    def run(self):
+        try:
+            self.start()
+
+            while self.poll():
+                # only wait when nothing finished, results already in
+                # hand are handled right away
+                if self.poll_interval and not self.last_done:
+                    time.sleep(self.poll_interval)
+        finally:
+            self.teardown()
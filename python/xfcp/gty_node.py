@@ -47,12 +47,127 @@ prbs_mode_mapping = {
 }
 
 
-class GTHE3CommonNode(node.MemoryNode):
+class DRPNode(node.MemoryNode):
+    """
+    DRP register access with an optional shadow cache
+
+    Once enabled with enable_shadow(), the last value read from or written
+    to each register is kept, so read-modify-write field setters on static
+    configuration registers only cost the write.  Writes queued on a
+    Batch update the shadow when they complete.  Registers in
+    volatile_ranges (byte address ranges) always go to the device.
+    """
+
+    volatile_ranges = [(0xfe00, 0x10000)]
+
+    def __init__(self, obj=None):
+        self.shadow = None
+        super().__init__(obj)
+
+    def enable_shadow(self, enable=True):
+        self.shadow = {} if enable else None
+
+    def invalidate(self, addr=None, count=1):
+        # drop cached values, for registers changed behind our back
+        if self.shadow is None:
+            return
+        if addr is None:
+            self.shadow.clear()
+        else:
+            for k in range(count):
+                self.shadow.pop(addr+k*2, None)
+
+    def is_volatile(self, addr):
+        return any(lo <= addr < hi for lo, hi in self.volatile_ranges)
+
+    def update_shadow(self, addr, data):
+        if self.shadow is None:
+            return
+        self.invalidate(addr & ~1, (len(data)+(addr & 1)+1)//2)
+        for a in range(addr+(addr & 1), addr+len(data)-1, 2):
+            if not self.is_volatile(a):
+                self.shadow[a] = int.from_bytes(data[a-addr:a-addr+2], 'little')
+
+    def build_write(self, addr, data):
+        # drop cached values when a write is issued by any path (sync
+        # write, write_field or a Batch); they are refilled on completion
+        self.invalidate(addr & ~1, (len(data)+(addr & 1)+1)//2)
+        return super().build_write(addr, data)
+
+    def write_done(self, addr, data):
+        self.update_shadow(addr, data)
+
+    def read(self, addr, count, window=None):
+        data = super().read(addr, count, window)
+        self.update_shadow(addr, data)
+        return data
+
+    def read_into(self, addr, buf, window=None):
+        count = super().read_into(addr, buf, window)
+        self.update_shadow(addr, memoryview(buf).cast('B'))
+        return count
+
+    def write(self, addr, data, window=None):
+        try:
+            ret = super().write(addr, data, window)
+        except Exception:
+            self.invalidate(addr & ~1, (len(data)+(addr & 1)+1)//2)
+            raise
+        self.update_shadow(addr, data)
+        return ret
+
+    def read_field(self, *ranges):
+        # little endian value spread over one or more (addr, count) ranges
+        # of consecutive registers, low word first; one block read per
+        # range, all in flight together
+        trs = [self.submit_read(addr, count*2) for addr, count in ranges]
+
+        val = 0
+        shift = 0
+        for (addr, count), tr in zip(ranges, trs):
+            data = tr.result()
+            if len(data) < count*2:
+                raise Exception("Short read at address 0x%x" % addr)
+            self.update_shadow(addr, data)
+            val |= int.from_bytes(data, 'little') << shift
+            shift += 16*count
+        return val
+
+    def write_field(self, val, *ranges):
+        # counterpart of read_field, one block write per range
+        trs = []
+        for addr, count in ranges:
+            data = (val & (2**(16*count)-1)).to_bytes(count*2, 'little')
+            val >>= 16*count
+            trs.append((addr, data, self.submit_write(addr, data)))
+
+        for addr, data, tr in trs:
+            try:
+                tr.result()
+            except Exception:
+                self.invalidate(addr, len(data)//2)
+                raise
+            self.update_shadow(addr, data)
+
+    def read_reg(self, addr):
+        if self.shadow is not None:
+            val = self.shadow.get(addr)
+            if val is not None:
+                return val
+        return self.read_word(addr)
+
     def masked_read(self, addr, mask):
-        return self.read_word(addr) & mask
+        return self.read_reg(addr) & mask
 
     def masked_write(self, addr, mask, val):
-        return self.write_word(addr, (self.read_word(addr) & ~mask) | (val & mask))
+        mask &= 0xffff
+        if mask == 0xffff:
+            # whole register, no need to read it first
+            return self.write_word(addr, val & mask)
+        return self.write_word(addr, (self.read_reg(addr) & ~mask) | (val & mask))
+
+
+class GTHE3CommonNode(DRPNode):
 
     # common registers
     def get_common_cfg0(self):
@@ -402,17 +517,25 @@ class GTYE4CommonNode(GTYE3CommonNode):
 node.register(GTYE4CommonNode, 0x8A92)
 
 
-class GTHE3ChannelNode(node.MemoryNode):
+class GTHE3ChannelNode(DRPNode):
+    # IO to channel, eye scan status and PRBS error counters
+    volatile_ranges = DRPNode.volatile_ranges + [
+        (0x0151*2, 0x0154*2),
+        (0x015e*2, 0x0160*2),
+        (0x0251*2, 0x0254*2),
+        (0x025e*2, 0x0260*2)
+    ]
+
+    # eye scan registers, for batched access (xfcp.eyescan)
+    es_control_addr = 0x003c*2
+    es_horz_offset_addr = 0x004f*2
+    es_vert_addr = 0x0097*2
+    es_status_addr = 0x0151*2
+
     def __init__(self, obj=None):
         self.rx_prbs_error = False
         super().__init__(obj)
 
-    def masked_read(self, addr, mask):
-        return self.read_word(addr) & mask
-
-    def masked_write(self, addr, mask, val):
-        return self.write_word(addr, (self.read_word(addr) & ~mask) | (val & mask))
-
     # IO to channel
     def get_reset(self):
         return bool(self.masked_read(0xfe00, 0x0001))
@@ -629,49 +752,22 @@ class GTHE3ChannelNode(node.MemoryNode):
         self.masked_write(0x003c*2, 0xfc00, val << 10)
 
     def get_es_qualifier(self):
-        val  = self.masked_read(0x003f*2, 0xffff) << 16*0
-        val |= self.masked_read(0x0040*2, 0xffff) << 16*1
-        val |= self.masked_read(0x0041*2, 0xffff) << 16*2
-        val |= self.masked_read(0x0042*2, 0xffff) << 16*3
-        val |= self.masked_read(0x0043*2, 0xffff) << 16*4
-        return val
+        return self.read_field((0x003f*2, 5))
 
     def set_es_qualifier(self, val):
-        self.masked_write(0x003f*2, 0xffff, (val >> 64*0))
-        self.masked_write(0x0040*2, 0xffff, (val >> 48*1))
-        self.masked_write(0x0041*2, 0xffff, (val >> 32*2))
-        self.masked_write(0x0042*2, 0xffff, (val >> 16*3))
-        self.masked_write(0x0043*2, 0xffff, (val >> 16*4))
+        self.write_field(val, (0x003f*2, 5))
 
     def get_es_qual_mask(self):
-        val  = self.masked_read(0x0044*2, 0xffff) << 16*0
-        val |= self.masked_read(0x0045*2, 0xffff) << 16*1
-        val |= self.masked_read(0x0046*2, 0xffff) << 16*2
-        val |= self.masked_read(0x0047*2, 0xffff) << 16*3
-        val |= self.masked_read(0x0048*2, 0xffff) << 16*4
-        return val
+        return self.read_field((0x0044*2, 5))
 
     def set_es_qual_mask(self, val):
-        self.masked_write(0x0044*2, 0xffff, (val >> 16*0))
-        self.masked_write(0x0045*2, 0xffff, (val >> 16*1))
-        self.masked_write(0x0046*2, 0xffff, (val >> 16*2))
-        self.masked_write(0x0047*2, 0xffff, (val >> 16*3))
-        self.masked_write(0x0048*2, 0xffff, (val >> 16*4))
+        self.write_field(val, (0x0044*2, 5))
 
     def get_es_sdata_mask(self):
-        val  = self.masked_read(0x0049*2, 0xffff) << 16*0
-        val |= self.masked_read(0x004a*2, 0xffff) << 16*1
-        val |= self.masked_read(0x004b*2, 0xffff) << 16*2
-        val |= self.masked_read(0x004c*2, 0xffff) << 16*3
-        val |= self.masked_read(0x004d*2, 0xffff) << 16*4
-        return val
+        return self.read_field((0x0049*2, 5))
 
     def set_es_sdata_mask(self, val):
-        self.masked_write(0x0049*2, 0xffff, (val >> 16*0))
-        self.masked_write(0x004a*2, 0xffff, (val >> 16*1))
-        self.masked_write(0x004b*2, 0xffff, (val >> 16*2))
-        self.masked_write(0x004c*2, 0xffff, (val >> 16*3))
-        self.masked_write(0x004d*2, 0xffff, (val >> 16*4))
+        self.write_field(val, (0x0049*2, 5))
 
     def get_es_mask_width(self):
         return 80
@@ -741,85 +837,30 @@ node.register(GTHE3ChannelNode, 0x8A81)
 
 
 class GTHE4ChannelNode(GTHE3ChannelNode):
+    es_status_addr = 0x0251*2
+
     # channel registers
     def get_rx_prbs_err_count(self):
         return self.read_dword(0x025e*2)
 
     # eye scan
     def get_es_qualifier(self):
-        val  = self.masked_read(0x003f*2, 0xffff) << 16*0
-        val |= self.masked_read(0x0040*2, 0xffff) << 16*1
-        val |= self.masked_read(0x0041*2, 0xffff) << 16*2
-        val |= self.masked_read(0x0042*2, 0xffff) << 16*3
-        val |= self.masked_read(0x0043*2, 0xffff) << 16*4
-        val |= self.masked_read(0x00e7*2, 0xffff) << 16*5
-        val |= self.masked_read(0x00e8*2, 0xffff) << 16*6
-        val |= self.masked_read(0x00e9*2, 0xffff) << 16*7
-        val |= self.masked_read(0x00ea*2, 0xffff) << 16*8
-        val |= self.masked_read(0x00eb*2, 0xffff) << 16*9
-        return val
+        return self.read_field((0x003f*2, 5), (0x00e7*2, 5))
 
     def set_es_qualifier(self, val):
-        self.masked_write(0x003f*2, 0xffff, (val >> 16*0))
-        self.masked_write(0x0040*2, 0xffff, (val >> 16*1))
-        self.masked_write(0x0041*2, 0xffff, (val >> 16*2))
-        self.masked_write(0x0042*2, 0xffff, (val >> 16*3))
-        self.masked_write(0x0043*2, 0xffff, (val >> 16*4))
-        self.masked_write(0x00e7*2, 0xffff, (val >> 16*5))
-        self.masked_write(0x00e8*2, 0xffff, (val >> 16*6))
-        self.masked_write(0x00e9*2, 0xffff, (val >> 16*7))
-        self.masked_write(0x00ea*2, 0xffff, (val >> 16*8))
-        self.masked_write(0x00eb*2, 0xffff, (val >> 16*9))
+        self.write_field(val, (0x003f*2, 5), (0x00e7*2, 5))
 
     def get_es_qual_mask(self):
-        val  = self.masked_read(0x0044*2, 0xffff) << 16*0
-        val |= self.masked_read(0x0045*2, 0xffff) << 16*1
-        val |= self.masked_read(0x0046*2, 0xffff) << 16*2
-        val |= self.masked_read(0x0047*2, 0xffff) << 16*3
-        val |= self.masked_read(0x0048*2, 0xffff) << 16*4
-        val |= self.masked_read(0x00ec*2, 0xffff) << 16*5
-        val |= self.masked_read(0x00ed*2, 0xffff) << 16*6
-        val |= self.masked_read(0x00ee*2, 0xffff) << 16*7
-        val |= self.masked_read(0x00ef*2, 0xffff) << 16*8
-        val |= self.masked_read(0x00f0*2, 0xffff) << 16*9
-        return val
+        return self.read_field((0x0044*2, 5), (0x00ec*2, 5))
 
     def set_es_qual_mask(self, val):
-        self.masked_write(0x0044*2, 0xffff, (val >> 16*0))
-        self.masked_write(0x0045*2, 0xffff, (val >> 16*1))
-        self.masked_write(0x0046*2, 0xffff, (val >> 16*2))
-        self.masked_write(0x0047*2, 0xffff, (val >> 16*3))
-        self.masked_write(0x0048*2, 0xffff, (val >> 16*4))
-        self.masked_write(0x00ec*2, 0xffff, (val >> 16*5))
-        self.masked_write(0x00ed*2, 0xffff, (val >> 16*6))
-        self.masked_write(0x00ee*2, 0xffff, (val >> 16*7))
-        self.masked_write(0x00ef*2, 0xffff, (val >> 16*8))
-        self.masked_write(0x00f0*2, 0xffff, (val >> 16*9))
+        self.write_field(val, (0x0044*2, 5), (0x00ec*2, 5))
 
     def get_es_sdata_mask(self):
-        val  = self.masked_read(0x0049*2, 0xffff) << 16*0
-        val |= self.masked_read(0x004a*2, 0xffff) << 16*1
-        val |= self.masked_read(0x004b*2, 0xffff) << 16*2
-        val |= self.masked_read(0x004c*2, 0xffff) << 16*3
-        val |= self.masked_read(0x004d*2, 0xffff) << 16*4
-        val |= self.masked_read(0x00f1*2, 0xffff) << 16*5
-        val |= self.masked_read(0x00f2*2, 0xffff) << 16*6
-        val |= self.masked_read(0x00f3*2, 0xffff) << 16*7
-        val |= self.masked_read(0x00f4*2, 0xffff) << 16*8
-        val |= self.masked_read(0x00f5*2, 0xffff) << 16*9
-        return val
+        return self.read_field((0x0049*2, 5), (0x00f1*2, 5))
 
     def set_es_sdata_mask(self, val):
-        self.masked_write(0x0049*2, 0xffff, (val >> 16*0))
-        self.masked_write(0x004a*2, 0xffff, (val >> 16*1))
-        self.masked_write(0x004b*2, 0xffff, (val >> 16*2))
-        self.masked_write(0x004c*2, 0xffff, (val >> 16*3))
-        self.masked_write(0x004d*2, 0xffff, (val >> 16*4))
-        self.masked_write(0x00f1*2, 0xffff, (val >> 16*5))
-        self.masked_write(0x00f2*2, 0xffff, (val >> 16*6))
-        self.masked_write(0x00f3*2, 0xffff, (val >> 16*7))
-        self.masked_write(0x00f4*2, 0xffff, (val >> 16*8))
-        self.masked_write(0x00f5*2, 0xffff, (val >> 16*9))
+        self.write_field(val, (0x0049*2, 5), (0x00f1*2, 5))
 
     def get_es_mask_width(self):
         return 160
@@ -837,85 +878,30 @@ node.register(GTHE4ChannelNode, 0x8A91)
 
 
 class GTYE3ChannelNode(GTHE3ChannelNode):
+    es_status_addr = 0x0251*2
+
     # channel registers
     def get_rx_prbs_err_count(self):
         return self.read_dword(0x025e*2)
 
     # eye scan
     def get_es_qualifier(self):
-        val  = self.masked_read(0x003f*2, 0xffff) << 16*0
-        val |= self.masked_read(0x0040*2, 0xffff) << 16*1
-        val |= self.masked_read(0x0041*2, 0xffff) << 16*2
-        val |= self.masked_read(0x0042*2, 0xffff) << 16*3
-        val |= self.masked_read(0x0043*2, 0xffff) << 16*4
-        val |= self.masked_read(0x00e7*2, 0xffff) << 16*5
-        val |= self.masked_read(0x00e8*2, 0xffff) << 16*6
-        val |= self.masked_read(0x00e9*2, 0xffff) << 16*7
-        val |= self.masked_read(0x00ea*2, 0xffff) << 16*8
-        val |= self.masked_read(0x00eb*2, 0xffff) << 16*9
-        return val
+        return self.read_field((0x003f*2, 5), (0x00e7*2, 5))
 
     def set_es_qualifier(self, val):
-        self.masked_write(0x003f*2, 0xffff, (val >> 16*0))
-        self.masked_write(0x0040*2, 0xffff, (val >> 16*1))
-        self.masked_write(0x0041*2, 0xffff, (val >> 16*2))
-        self.masked_write(0x0042*2, 0xffff, (val >> 16*3))
-        self.masked_write(0x0043*2, 0xffff, (val >> 16*4))
-        self.masked_write(0x00e7*2, 0xffff, (val >> 16*5))
-        self.masked_write(0x00e8*2, 0xffff, (val >> 16*6))
-        self.masked_write(0x00e9*2, 0xffff, (val >> 16*7))
-        self.masked_write(0x00ea*2, 0xffff, (val >> 16*8))
-        self.masked_write(0x00eb*2, 0xffff, (val >> 16*9))
+        self.write_field(val, (0x003f*2, 5), (0x00e7*2, 5))
 
     def get_es_qual_mask(self):
-        val  = self.masked_read(0x0044*2, 0xffff) << 16*0
-        val |= self.masked_read(0x0045*2, 0xffff) << 16*1
-        val |= self.masked_read(0x0046*2, 0xffff) << 16*2
-        val |= self.masked_read(0x0047*2, 0xffff) << 16*3
-        val |= self.masked_read(0x0048*2, 0xffff) << 16*4
-        val |= self.masked_read(0x00ec*2, 0xffff) << 16*5
-        val |= self.masked_read(0x00ed*2, 0xffff) << 16*6
-        val |= self.masked_read(0x00ee*2, 0xffff) << 16*7
-        val |= self.masked_read(0x00ef*2, 0xffff) << 16*8
-        val |= self.masked_read(0x00f0*2, 0xffff) << 16*9
-        return val
+        return self.read_field((0x0044*2, 5), (0x00ec*2, 5))
 
     def set_es_qual_mask(self, val):
-        self.masked_write(0x0044*2, 0xffff, (val >> 16*0))
-        self.masked_write(0x0045*2, 0xffff, (val >> 16*1))
-        self.masked_write(0x0046*2, 0xffff, (val >> 16*2))
-        self.masked_write(0x0047*2, 0xffff, (val >> 16*3))
-        self.masked_write(0x0048*2, 0xffff, (val >> 16*4))
-        self.masked_write(0x00ec*2, 0xffff, (val >> 16*5))
-        self.masked_write(0x00ed*2, 0xffff, (val >> 16*6))
-        self.masked_write(0x00ee*2, 0xffff, (val >> 16*7))
-        self.masked_write(0x00ef*2, 0xffff, (val >> 16*8))
-        self.masked_write(0x00f0*2, 0xffff, (val >> 16*9))
+        self.write_field(val, (0x0044*2, 5), (0x00ec*2, 5))
 
     def get_es_sdata_mask(self):
-        val  = self.masked_read(0x0049*2, 0xffff) << 16*0
-        val |= self.masked_read(0x004a*2, 0xffff) << 16*1
-        val |= self.masked_read(0x004b*2, 0xffff) << 16*2
-        val |= self.masked_read(0x004c*2, 0xffff) << 16*3
-        val |= self.masked_read(0x004d*2, 0xffff) << 16*4
-        val |= self.masked_read(0x00f1*2, 0xffff) << 16*5
-        val |= self.masked_read(0x00f2*2, 0xffff) << 16*6
-        val |= self.masked_read(0x00f3*2, 0xffff) << 16*7
-        val |= self.masked_read(0x00f4*2, 0xffff) << 16*8
-        val |= self.masked_read(0x00f5*2, 0xffff) << 16*9
-        return val
+        return self.read_field((0x0049*2, 5), (0x00f1*2, 5))
 
     def set_es_sdata_mask(self, val):
-        self.masked_write(0x0049*2, 0xffff, (val >> 16*0))
-        self.masked_write(0x004a*2, 0xffff, (val >> 16*1))
-        self.masked_write(0x004b*2, 0xffff, (val >> 16*2))
-        self.masked_write(0x004c*2, 0xffff, (val >> 16*3))
-        self.masked_write(0x004d*2, 0xffff, (val >> 16*4))
-        self.masked_write(0x00f1*2, 0xffff, (val >> 16*5))
-        self.masked_write(0x00f2*2, 0xffff, (val >> 16*6))
-        self.masked_write(0x00f3*2, 0xffff, (val >> 16*7))
-        self.masked_write(0x00f4*2, 0xffff, (val >> 16*8))
-        self.masked_write(0x00f5*2, 0xffff, (val >> 16*9))
+        self.write_field(val, (0x0049*2, 5), (0x00f1*2, 5))
 
     def get_es_mask_width(self):
         return 160
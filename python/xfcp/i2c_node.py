@@ -29,6 +29,8 @@ from . import node
 
 
 class I2CPacket(packet.Packet):
+    __slots__ = ()
+
     def __init__(self, payload=b'', path=(), rpath=(), ptype=0x2C):
         super().__init__(payload, path, rpath, ptype)
 
@@ -130,7 +132,7 @@ class I2CPacket(packet.Packet):
             data = bytearray([self.payload[1]])
             if self.payload[0] & 0x10 == 0x10:
                 count = self.payload[1]
-                data = self.payload[2:count+2]
+                data = bytes(self.payload[2:count+2])
                 self.payload = self.payload[2+count:]
             else:
                 self.payload = self.payload[2:]
@@ -158,7 +160,7 @@ class I2CPacket(packet.Packet):
             data = bytearray([self.payload[1]])
             if self.payload[0] & 0x10 == 0x10:
                 count = self.payload[1]
-                data = self.payload[2:count+2]
+                data = bytes(self.payload[2:count+2])
                 self.payload = self.payload[2+count:]
             else:
                 self.payload = self.payload[2:]
@@ -174,6 +176,8 @@ class I2CPacket(packet.Packet):
 
 
 class I2CRequestPacket(I2CPacket):
+    __slots__ = ()
+
     def __init__(self, payload=b'', path=(), rpath=(), ptype=0x2C):
         super().__init__(payload, path, rpath, ptype)
 
@@ -199,6 +203,8 @@ packet.register(I2CRequestPacket, 0x2C)
 
 
 class I2CResponsePacket(I2CPacket):
+    __slots__ = ()
+
     def __init__(self, payload=b'', path=(), rpath=(), ptype=0x2D):
         super().__init__(payload, path, rpath, ptype)
 
@@ -227,55 +233,90 @@ class I2CNode(node.Node):
     def __init__(self, obj=None):
         super(I2CNode, self).__init__(obj)
 
-    def read_i2c(self, addr, count):
+    def build_read_i2c(self, addr, count):
         pkt = I2CRequestPacket()
         pkt.path = self.path
         pkt.pack_set_addr(addr)
         pkt.pack_read(count, stop=True)
-        self.interface.send(pkt)
-        pkt = self.interface.receive()
+        return pkt
+
+    def parse_read_i2c(self, pkt):
         pkt.unpack_set_addr()
         read = pkt.unpack_read()
         return read[0]
 
-    def write_i2c(self, addr, data):
+    def read_i2c(self, addr, count):
+        return self.interface.transact(self.build_read_i2c(addr, count), self.parse_read_i2c)
+
+    async def read_i2c_async(self, addr, count):
+        return await self.interface.transact(self.build_read_i2c(addr, count), self.parse_read_i2c)
+
+    def build_write_i2c(self, addr, data):
         pkt = I2CRequestPacket()
         pkt.path = self.path
         pkt.pack_set_addr(addr)
         pkt.pack_write(data, stop=True)
-        self.interface.send(pkt)
-        pkt = self.interface.receive()
+        return pkt
+
+    def parse_write_i2c(self, pkt):
         pkt.unpack_set_addr()
         write = pkt.unpack_write()
         return len(write[0])
 
-    def write_read_i2c(self, addr, data, count):
+    def write_i2c(self, addr, data):
+        return self.interface.transact(self.build_write_i2c(addr, data), self.parse_write_i2c)
+
+    async def write_i2c_async(self, addr, data):
+        return await self.interface.transact(self.build_write_i2c(addr, data), self.parse_write_i2c)
+
+    def build_write_read_i2c(self, addr, data, count):
         pkt = I2CRequestPacket()
         pkt.path = self.path
         pkt.pack_set_addr(addr)
         pkt.pack_write(data)
         pkt.pack_read(count, stop=True)
-        self.interface.send(pkt)
-        pkt = self.interface.receive()
+        return pkt
+
+    def parse_write_read_i2c(self, pkt):
         pkt.unpack_set_addr()
         write = pkt.unpack_write()
         read = pkt.unpack_read()
         return read[0]
 
-    def get_i2c_status(self):
+    def write_read_i2c(self, addr, data, count):
+        return self.interface.transact(self.build_write_read_i2c(addr, data, count), self.parse_write_read_i2c)
+
+    async def write_read_i2c_async(self, addr, data, count):
+        return await self.interface.transact(self.build_write_read_i2c(addr, data, count), self.parse_write_read_i2c)
+
+    def build_get_i2c_status(self):
         pkt = I2CRequestPacket()
         pkt.path = self.path
         pkt.pack_status_query()
-        self.interface.send(pkt)
-        pkt = self.interface.receive()
+        return pkt
+
+    def parse_get_i2c_status(self, pkt):
         return pkt.unpack_status_query()
 
-    def set_i2c_prescale(self, prescale):
+    def get_i2c_status(self):
+        return self.interface.transact(self.build_get_i2c_status(), self.parse_get_i2c_status)
+
+    async def get_i2c_status_async(self):
+        return await self.interface.transact(self.build_get_i2c_status(), self.parse_get_i2c_status)
+
+    def build_set_i2c_prescale(self, prescale):
         pkt = I2CRequestPacket()
         pkt.path = self.path
         pkt.pack_set_prescale(prescale)
-        self.interface.send(pkt)
-        pkt = self.interface.receive()
+        return pkt
+
+    def parse_set_i2c_prescale(self, pkt):
         return pkt.unpack_set_prescale()
 
+    def set_i2c_prescale(self, prescale):
+        return self.interface.transact(self.build_set_i2c_prescale(prescale), self.parse_set_i2c_prescale)
+
+    async def set_i2c_prescale_async(self, prescale):
+        return await self.interface.transact(self.build_set_i2c_prescale(prescale), self.parse_set_i2c_prescale)
+
 node.register(I2CNode, 0x2C00, 8)
@@ -22,74 +22,81 @@ THE SOFTWARE.
 
 """
 
+import concurrent.futures
+import contextlib
+import queue
+import selectors
 import serial
 import socket
+import threading
+import time
 
 from . import packet
 from . import node
-
-
-def cobs_encode(block):
-    block = bytearray(block)
-    enc = bytearray()
-
-    seg = bytearray()
-    code = 1
-
-    new_data = True
-
-    for b in block:
-        if b == 0:
-            enc.append(code)
-            enc.extend(seg)
-            code = 1
-            seg = bytearray()
-            new_data = True
-        else:
-            code += 1
-            seg.append(b)
-            new_data = True
-            if code == 255:
-                enc.append(code)
-                enc.extend(seg)
-                code = 1
-                seg = bytearray()
-                new_data = False
-
-    if new_data:
-        enc.append(code)
-        enc.extend(seg)
-
-    return bytes(enc)
-
-
-def cobs_decode(block):
-    block = bytearray(block)
-    dec = bytearray()
-
-    code = 0
-
-    i = 0
-
-    if 0 in block:
-        return None
-
-    while i < len(block):
-        code = block[i]
-        i += 1
-        if i+code-1 > len(block):
-            return None
-        dec.extend(block[i:i+code-1])
-        i += code-1
-        if code < 255 and i < len(block):
-            dec.append(0)
-
-    return bytes(dec)
+from . import enum_cache
+from .batch import Batch
+from .cobs_codec import cobs_encode, cobs_decode
+
+
+class Transaction(object):
+    def __init__(self, interface, pkt, callback=None):
+        self.interface = interface
+        self.pkt = pkt
+        self.callback = callback
+        self.tag = None
+        self.response = None
+        self.value = None
+        self.exception = None
+        self.complete = False
+
+    def done(self):
+        return self.complete
+
+    def set_response(self, pkt):
+        self.response = pkt
+        try:
+            if self.callback is not None:
+                self.value = self.callback(pkt)
+            else:
+                self.value = pkt
+        except Exception as ex:
+            self.exception = ex
+        self.complete = True
+
+    def set_exception(self, ex):
+        self.exception = ex
+        self.complete = True
+
+    def result(self):
+        while not self.complete:
+            try:
+                self.interface.poll()
+            except Exception:
+                self.interface.cancel(self)
+                raise
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(pkt={self.pkt}, "
+            f"tag={self.tag}, "
+            f"complete={self.complete})"
+        )
 
 
 class Interface(object):
-    def __init__(self):
+    # requests are tagged with a two byte rpath prefix; rpath bytes must be
+    # below 0xFE, so there are 0xFE*0xFE distinct tags
+    tag_count = 0xfe*0xfe
+
+    def __init__(self, window=1, max_packet_size=None):
         self._root = None
+        self.window = window
+        self.max_packet_size = max_packet_size
+        self.pending = {}
+        self.next_tag = 0
 
     def send(self, packet):
         raise NotImplementedError()
@@ -97,8 +104,77 @@ class Interface(object):
     def receive(self):
         raise NotImplementedError()
 
-    def enumerate(self):
-        self._root = node.enumerate_interface(self)
+    def close(self):
+        pass
+
+    def alloc_tag(self):
+        while True:
+            n = self.next_tag
+            self.next_tag = (n+1) % self.tag_count
+            tag = (n // 0xfe, n % 0xfe)
+            if tag not in self.pending:
+                return tag
+
+    def submit(self, pkt, callback=None):
+        while len(self.pending) >= max(self.window, 1):
+            self.poll()
+
+        return self.issue(Transaction(self, pkt, callback))
+
+    def issue(self, tr):
+        tr.tag = self.alloc_tag()
+        tr.pkt.rpath = tr.tag + tuple(tr.pkt.rpath)
+        self.pending[tr.tag] = tr
+        try:
+            self.send(tr.pkt)
+        except Exception:
+            del self.pending[tr.tag]
+            raise
+        return tr
+
+    def transact(self, pkt, callback=None):
+        return self.submit(pkt, callback).result()
+
+    def poll(self):
+        return self.dispatch(self.receive())
+
+    def dispatch(self, pkt):
+        # match response to request by rpath tag, drop anything unknown
+        tag = tuple(pkt.rpath[:2])
+        tr = self.pending.get(tag)
+        if tr is None or tuple(pkt.path) != tuple(tr.pkt.path):
+            return None
+        del self.pending[tag]
+        pkt.rpath = pkt.rpath[2:]
+        tr.set_response(pkt)
+        return tr
+
+    def cancel(self, tr):
+        if self.pending.get(tr.tag) is tr:
+            del self.pending[tr.tag]
+
+    def flush(self):
+        while self.pending:
+            tr = next(iter(self.pending.values()))
+            try:
+                self.poll()
+            except Exception:
+                self.cancel(tr)
+                raise
+
+    def batch(self, window=None):
+        return Batch(self, None, window)
+
+    def cache_key(self):
+        # identifies the endpoint for the enumeration cache
+        return None
+
+    def enumerate(self, cache=None, lazy=False):
+        if cache is not None:
+            if cache is True:
+                cache = enum_cache.EnumerationCache()
+            return cache.enumerate(self, lazy)
+        self._root = node.enumerate_interface(self, lazy=lazy)
         return self._root
 
     def get_root(self):
@@ -108,31 +184,105 @@ class Interface(object):
 
 
 class SerialInterface(Interface):
-    def __init__(self, port='/dev/ttyUSB0', baud=115200, timeout=10):
-        super().__init__()
+    def __init__(self, port='/dev/ttyUSB0', baud=115200, timeout=10, window=1):
+        super().__init__(window)
 
         self.port = port
         self.baud = baud
-        self.serial_port = serial.Serial(port, baud, timeout=timeout)
-
-    @property
-    def timeout(self):
-        return self.serial_port.timeout
-
-    @timeout.setter
-    def timeout(self, value):
-        self.serial_port.timeout = value
+        self.timeout = timeout
+
+        # short port timeout so the receive thread notices close()
+        self.serial_port = serial.Serial(port, baud, timeout=0.1)
+
+        self.rx_queue = queue.Queue()
+        self.rx_chunk_size = 65536
+        self.running = True
+        self.rx_thread = threading.Thread(target=self.run_rx, daemon=True)
+        self.rx_thread.start()
+
+    def close(self):
+        self.running = False
+        if self.rx_thread is not threading.current_thread():
+            self.rx_thread.join()
+        self.serial_port.close()
+
+    def run_rx(self):
+        buf = bytearray()
+
+        while self.running:
+            try:
+                # block for the first byte, then take whatever is buffered
+                data = self.serial_port.read(min(max(self.serial_port.in_waiting, 1), self.rx_chunk_size))
+            except Exception as ex:
+                if self.running:
+                    self.rx_queue.put(ex)
+                return
+
+            if not data:
+                continue
+
+            # only the new data can contain frame delimiters
+            search = len(buf)
+            buf += data
+            start = 0
+
+            while True:
+                end = buf.find(0, search)
+                if end < 0:
+                    break
+
+                if end > start:
+                    frame = cobs_decode(memoryview(buf)[start:end])
+                    if frame:
+                        try:
+                            self.rx_queue.put(packet.parse(frame))
+                        except Exception:
+                            # drop malformed packets
+                            pass
+
+                start = search = end+1
+
+            if start:
+                del buf[:start]
+
+    def cache_key(self):
+        return 'serial:%s' % self.port
 
     def send(self, pkt):
         self.serial_port.write(cobs_encode(pkt.build())+b'\x00')
 
     def receive(self):
-        return packet.parse(cobs_decode(self.serial_port.read_until(b'\x00')[:-1]))
+        try:
+            item = self.rx_queue.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError("Timed out waiting for packet on %s" % self.port) from None
+        if isinstance(item, Exception):
+            raise item
+        return item
 
 
 class UDPInterface(Interface):
-    def __init__(self, host, port=14000, timeout=10):
-        super().__init__()
+    """
+    UDP interface with loss recovery
+
+    Every request gets a deadline of timeout seconds.  Reads and ID
+    requests have no side effects, so they are retransmitted when no
+    response arrives within the retransmit timeout, which tracks the
+    measured round trip time (as in RFC 6298).  Writes and I2C operations
+    are never resent.  Responses to requests that already completed or
+    were given up on are discarded.
+    """
+
+    # ptypes that are safe to send more than once
+    idempotent_ptypes = {0x10, 0xfe}
+
+    initial_rto = 0.1
+    min_rto = 0.002
+    max_rto = 1.0
+
+    def __init__(self, host, port=14000, timeout=10, window=1, mtu=1500, sock=None):
+        # IPv4 and UDP headers
+        super().__init__(window, mtu-28)
 
         if ':' in host:
             host, port = host.rsplit(':', 2)
@@ -140,19 +290,475 @@ class UDPInterface(Interface):
 
         self.host = host
         self.port = port
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.settimeout(timeout)
+        self.addr = (socket.gethostbyname(host), port)
+        self.timeout = timeout
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket = sock
+
+        self.srtt = None
+        self.rttvar = None
+        self.rto = self.initial_rto
+
+        self.retransmits = 0
+        self.stale_responses = 0
+
+    def cache_key(self):
+        return 'udp:%s:%d' % self.addr
+
+    def send(self, pkt):
+        self.socket.sendto(pkt.build(), self.addr)
+
+    def close(self):
+        self.socket.close()
+
+    def receive(self):
+        return packet.parse(self.socket.recvfrom(65536)[0])
+
+    def issue(self, tr):
+        now = time.monotonic()
+        tr.deadline = now+self.timeout
+        tr.sent = now
+        tr.transmissions = 1
+        if tr.pkt.ptype in self.idempotent_ptypes:
+            tr.rto = self.rto
+            tr.retransmit_at = now+tr.rto
+        else:
+            tr.retransmit_at = None
+        return super().issue(tr)
+
+    def dispatch(self, pkt):
+        tr = super().dispatch(pkt)
+        if tr is None:
+            self.stale_responses += 1
+            return tr
+        now = time.monotonic()
+        if tr.transmissions == 1:
+            # only unambiguous samples (Karn's algorithm)
+            self.update_rtt(now-tr.sent)
+        # the link is making progress, so requests queued behind this one
+        # get a full RTO from now (restarting the timer, as in TCP)
+        for other in self.pending.values():
+            if other.retransmit_at is not None:
+                other.retransmit_at = max(other.retransmit_at, now+other.rto)
+        return tr
+
+    def dispatch_datagram(self, data):
+        try:
+            pkt = packet.parse(data)
+        except Exception:
+            # malformed packet
+            return None
+        return self.dispatch(pkt)
+
+    def update_rtt(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt/2
+        else:
+            self.rttvar = 0.75*self.rttvar + 0.25*abs(self.srtt-rtt)
+            self.srtt = 0.875*self.srtt + 0.125*rtt
+        self.rto = min(max(self.srtt+4*self.rttvar, self.min_rto), self.max_rto)
+
+    def next_event(self):
+        # time of the next retransmit or deadline, None when idle
+        wake = None
+        for tr in self.pending.values():
+            t = tr.deadline
+            if tr.retransmit_at is not None:
+                t = min(t, tr.retransmit_at)
+            if wake is None or t < wake:
+                wake = t
+        return wake
+
+    def service_timers(self, now):
+        for tr in list(self.pending.values()):
+            if now >= tr.deadline:
+                self.cancel(tr)
+                tr.set_exception(TimeoutError("Timed out waiting for response to %s" % tr.pkt))
+            elif tr.retransmit_at is not None and now >= tr.retransmit_at:
+                tr.rto = min(tr.rto*2, self.max_rto)
+                tr.retransmit_at = now+tr.rto
+                tr.transmissions += 1
+                self.retransmits += 1
+                self.send(tr.pkt)
+
+    def poll(self):
+        # wait for a response, but no longer than the next retransmit or
+        # deadline (or timeout, when idle)
+        now = time.monotonic()
+        wake = self.next_event()
+        if wake is None or wake > now+self.timeout:
+            wake = now+self.timeout
+
+        self.socket.settimeout(max(wake-now, 0))
+
+        try:
+            data = self.socket.recvfrom(65536)[0]
+        except (socket.timeout, BlockingIOError):
+            if not self.pending:
+                raise
+        else:
+            return self.dispatch_datagram(data)
+
+        self.service_timers(time.monotonic())
+        return None
+
+
+class PoolInterface(UDPInterface):
+    """
+    UDP interface driven by an InterfacePool
+    """
+
+    def __init__(self, pool, host, port=14000, timeout=10, window=1, mtu=1500, sock=None):
+        super().__init__(host, port, timeout, window, mtu, sock)
+
+        self.pool = pool
+        self.socket.setblocking(False)
+
+    def close(self):
+        self.pool.remove(self)
+
+    def poll(self):
+        self.pool.poll(self.timeout)
+
+
+class InterfacePool(object):
+    """
+    Drives many UDP interfaces from one selector loop
+
+    Responses are dispatched by source address, so requests submitted to
+    several boards are all in flight at once and waiting on any one of
+    them services the rest.  With shared_socket, all boards are reached
+    through a single UDP socket.
+    """
+
+    def __init__(self, shared_socket=False, timeout=10, window=1, mtu=1500):
+        self.timeout = timeout
+        self.window = window
+        self.mtu = mtu
+
+        self.selector = selectors.DefaultSelector()
+        self.interfaces = {}
+        self.socket = None
+
+        if shared_socket:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket.setblocking(False)
+            self.selector.register(self.socket, selectors.EVENT_READ, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __iter__(self):
+        return iter(list(self.interfaces.values()))
+
+    def __len__(self):
+        return len(self.interfaces)
+
+    def add(self, host, port=14000, timeout=None, window=None, mtu=None):
+        iface = PoolInterface(self, host, port,
+            self.timeout if timeout is None else timeout,
+            self.window if window is None else window,
+            self.mtu if mtu is None else mtu,
+            self.socket)
+
+        if iface.addr in self.interfaces:
+            if self.socket is None:
+                iface.socket.close()
+            raise Exception("Duplicate address %s:%d" % iface.addr)
+
+        self.interfaces[iface.addr] = iface
+        if self.socket is None:
+            self.selector.register(iface.socket, selectors.EVENT_READ, iface)
+        return iface
+
+    def remove(self, iface):
+        if self.interfaces.get(iface.addr) is not iface:
+            return
+        del self.interfaces[iface.addr]
+        if iface.socket is not self.socket:
+            self.selector.unregister(iface.socket)
+            iface.socket.close()
+
+    def close(self):
+        for iface in list(self.interfaces.values()):
+            self.remove(iface)
+        if self.socket is not None:
+            self.selector.unregister(self.socket)
+            self.socket.close()
+            self.socket = None
+        self.selector.close()
+
+    def pending(self):
+        return sum(len(iface.pending) for iface in self.interfaces.values())
+
+    def poll(self, timeout=None):
+        # one pass of the event loop: receive everything that is ready,
+        # then run retransmit and deadline timers
+        now = time.monotonic()
+        wake = now+(self.timeout if timeout is None else timeout)
+        for iface in self.interfaces.values():
+            t = iface.next_event()
+            if t is not None and t < wake:
+                wake = t
+
+        count = 0
+
+        for key, events in self.selector.select(max(wake-now, 0)):
+            sock = key.fileobj
+            while True:
+                try:
+                    data, addr = sock.recvfrom(65536)
+                except (BlockingIOError, InterruptedError):
+                    break
+                iface = self.interfaces.get(addr)
+                if iface is None or (key.data is not None and key.data is not iface):
+                    continue
+                if iface.dispatch_datagram(data) is not None:
+                    count += 1
+
+        now = time.monotonic()
+        for iface in list(self.interfaces.values()):
+            iface.service_timers(now)
+
+        return count
+
+    def flush(self):
+        while self.pending():
+            self.poll()
+
+    def identify(self, paths, strict=True):
+        # ID requests for paths on each interface, all boards at once;
+        # paths maps interfaces to lists of paths.  Unless strict, paths
+        # that time out are left out of the result.
+        with contextlib.ExitStack() as stack:
+            for iface, lst in paths.items():
+                stack.enter_context(node.override_window(iface, max(iface.window, min(len(lst), node.identify_window))))
+            trs = [(iface, p, iface.submit(packet.IDRequestPacket(path=p))) for iface, lst in paths.items() for p in lst]
+            resp = {iface: {} for iface in paths}
+            for iface, p, tr in trs:
+                try:
+                    resp[iface][p] = tr.result()
+                except TimeoutError:
+                    if strict:
+                        raise
+        return resp
+
+    def enumerate(self, cache=None, lazy=False):
+        # every step runs on all boards together, so enumerating the pool
+        # takes about as many round trips as one board
+        ifaces = list(self.interfaces.values())
+        ids = self.identify({iface: [()] for iface in ifaces})
+
+        if cache is True:
+            cache = enum_cache.EnumerationCache()
+
+        cached = {}
+        if cache is not None:
+            for iface in ifaces:
+                key = iface.cache_key()
+                c = cache.get_ids(key, ids[iface][()].payload) if key is not None else None
+                if c is not None:
+                    cached[iface] = c
+
+            stages = {iface: cache.stages(c) for iface, c in cached.items()}
+            for k in range(max((len(st) for st in stages.values()), default=0)):
+                resp = self.identify({iface: st[k] for iface, st in stages.items() if iface in cached and k < len(st)}, False)
+                for iface, r in resp.items():
+                    c = cached[iface]
+                    if any(p not in r or bytes(r[p].payload) != bytes(c[p].payload) for p in stages[iface][k]):
+                        del cached[iface]
+
+            ids.update(cached)
+
+        if not lazy:
+            level = {iface: node.child_paths((), ids[iface][()]) for iface in ifaces if iface not in cached}
+            while any(level.values()):
+                resp = self.identify(level)
+                for iface in level:
+                    ids[iface].update(resp[iface])
+                    level[iface] = [q for p in level[iface] for q in node.child_paths(p, ids[iface][p])]
+
+        for iface in ifaces:
+            iface._root = node.enumerate_interface(iface, ids=ids[iface], lazy=lazy)
+            if cache is not None and iface not in cached and iface.cache_key() is not None:
+                if lazy:
+                    cache.invalidate(iface)
+                else:
+                    cache.put_ids(iface.cache_key(), node.collect_ids(iface._root))
+
+        return [iface._root for iface in ifaces]
+
+
+class ThreadedInterface(Interface):
+    """
+    Thread safe wrapper around another interface
+
+    The wrapped interface is only touched from a single I/O thread.
+    Requests can be submitted from any thread and are returned as
+    concurrent.futures.Future objects, so the synchronous node API works
+    unchanged on top of this interface.
+    """
+
+    # receive slice, bounds the latency of picking up new requests
+    poll_interval = 0.01
+
+    def __init__(self, interface, timeout=10):
+        super().__init__(interface.window, interface.max_packet_size)
+
+        self.interface = interface
+        self.timeout = timeout
+
+        self.requests = queue.Queue()
+        self.futures = {}
+        self.running = True
+        self.io_thread = threading.Thread(target=self.run_io, daemon=True)
+        self.io_thread.start()
 
     @property
-    def timeout(self):
-        return self.socket.gettimeout()
+    def window(self):
+        return self.interface.window
 
-    @timeout.setter
-    def timeout(self, value):
-        self.socket.settimeout(value)
+    @window.setter
+    def window(self, value):
+        if hasattr(self, 'interface'):
+            self.interface.window = value
+
+    @property
+    def max_packet_size(self):
+        return self.interface.max_packet_size
+
+    @max_packet_size.setter
+    def max_packet_size(self, value):
+        if hasattr(self, 'interface'):
+            self.interface.max_packet_size = value
+
+    def close(self):
+        self.running = False
+        self.requests.put(None)
+        if self.io_thread is not threading.current_thread():
+            self.io_thread.join()
+        self.interface.close()
+
+    def cache_key(self):
+        return self.interface.cache_key()
 
     def send(self, pkt):
-        self.socket.sendto(pkt.build(), (self.host, self.port))
+        raise Exception("Use submit or transact on a ThreadedInterface")
 
     def receive(self):
-        return packet.parse(self.socket.recvfrom(1500)[0])
+        raise Exception("Use submit or transact on a ThreadedInterface")
+
+    def submit(self, pkt, callback=None):
+        if not self.running:
+            raise Exception("Interface closed")
+        fut = concurrent.futures.Future()
+        self.requests.put((pkt, callback, fut))
+        return fut
+
+    def transact(self, pkt, callback=None):
+        return self.submit(pkt, callback).result()
+
+    def poll(self):
+        raise Exception("Responses are handled by the I/O thread")
+
+    def cancel(self, tr):
+        if isinstance(tr, concurrent.futures.Future):
+            tr.cancel()
+
+    def flush(self):
+        fut = concurrent.futures.Future()
+        self.requests.put(fut)
+        fut.result()
+
+    def run_io(self):
+        iface = self.interface
+        flushes = []
+        queued = []
+
+        while self.running or iface.pending:
+            # pick up new requests, blocking only when idle
+            try:
+                if not iface.pending and not queued and not flushes:
+                    item = self.requests.get()
+                else:
+                    item = self.requests.get_nowait()
+                while True:
+                    if item is None:
+                        pass
+                    elif isinstance(item, concurrent.futures.Future):
+                        flushes.append(item)
+                    else:
+                        queued.append(item)
+                    item = self.requests.get_nowait()
+            except queue.Empty:
+                pass
+
+            # issue as many as the window allows
+            while queued and len(iface.pending) < max(iface.window, 1):
+                pkt, callback, fut = queued.pop(0)
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                try:
+                    tr = iface.issue(Transaction(iface, pkt, callback))
+                except Exception as ex:
+                    fut.set_exception(ex)
+                    continue
+                self.futures[tr.tag] = (tr, fut, time.monotonic()+self.timeout)
+
+            if not self.running and not iface.pending:
+                for pkt, callback, fut in queued:
+                    fut.cancel()
+                queued = []
+                break
+
+            if iface.pending:
+                self.poll_interface()
+
+            if not iface.pending and not queued:
+                for fut in flushes:
+                    fut.set_result(None)
+                flushes = []
+
+        for fut in flushes:
+            fut.set_result(None)
+
+    def poll_interface(self):
+        iface = self.interface
+        timeout = iface.timeout
+        iface.timeout = self.poll_interval
+
+        try:
+            iface.poll()
+        except TimeoutError:
+            pass
+        except Exception as ex:
+            # interface failure, fail everything in flight
+            for tr, fut, deadline in list(self.futures.values()):
+                iface.cancel(tr)
+                self.finish(tr, ex)
+            return
+        finally:
+            iface.timeout = timeout
+
+        # complete finished requests, expire ones that have waited too long
+        now = time.monotonic()
+        for tr, fut, deadline in list(self.futures.values()):
+            if tr.complete:
+                self.finish(tr)
+            elif deadline < now:
+                iface.cancel(tr)
+                self.finish(tr, TimeoutError("Timed out waiting for response to %s" % tr.pkt))
+
+    def finish(self, tr, ex=None):
+        tr, fut, deadline = self.futures.pop(tr.tag)
+        if ex is None:
+            ex = tr.exception
+        if ex is not None:
+            fut.set_exception(ex)
+        else:
+            fut.set_result(tr.value)
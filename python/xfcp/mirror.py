@@ -0,0 +1,304 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import bisect
+
+from .node import MemoryNode
+
+
+class MemoryMirror(object):
+    """
+    Paged, write-back host copy of a MemoryNode address range
+
+    Pages are read from the device on first access, after which reads and
+    writes only touch the local copy.  write() records the exact ranges
+    written and flush() merges them into as few write requests as
+    possible, all in flight together.  view() returns a memoryview of the
+    local copy and is the supported way to get at it as a buffer (i.e.
+    for NumPy); pages exposed through writable views are compared against
+    the last known device contents on flush, so only bytes that changed
+    are written back.
+
+    With merge_gap set, dirty ranges separated by up to that many cached
+    bytes are sent as one write, rewriting the bytes in between; only use
+    this where rewriting unchanged data is harmless (i.e. RAM, not
+    registers with side effects).
+    """
+
+    def __init__(self, node, addr, size, page_size=4096, merge_gap=0):
+        self.node = node
+        self.addr = addr
+        self.size = size
+        self.page_size = page_size
+        self.merge_gap = merge_gap
+
+        npages = (size+page_size-1)//page_size
+
+        self.buf = bytearray(size)
+        # device contents as of the last fetch or flush
+        self.clean = bytearray(size)
+        self.valid = bytearray(npages)
+        self.exposed = set()
+        # sorted, disjoint (start, end) offsets
+        self.dirty = []
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.size)
+            if step != 1:
+                raise Exception("Extended slices not supported")
+            return self.read(self.addr+start, max(stop-start, 0))
+        if key < 0:
+            key += self.size
+        return self.read(self.addr+key, 1)[0]
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.size)
+            if step != 1 or len(value) != max(stop-start, 0):
+                raise Exception("Slice assignment must not change size")
+            self.write(self.addr+start, value)
+        else:
+            if key < 0:
+                key += self.size
+            self.write(self.addr+key, [value])
+
+    def offset(self, addr, count):
+        offset = addr-self.addr
+        if offset < 0 or offset+count > self.size:
+            raise Exception("Range 0x%x-0x%x outside of mirror" % (addr, addr+count))
+        return offset
+
+    def pages(self, offset, count):
+        return range(offset//self.page_size, (offset+max(count, 1)-1)//self.page_size+1)
+
+    def fetch(self, pages):
+        # read missing pages, consecutive pages as one range, all requests
+        # in flight together
+        runs = []
+        for p in pages:
+            if self.valid[p]:
+                continue
+            if runs and runs[-1][1] == p:
+                runs[-1][1] = p+1
+            else:
+                runs.append([p, p+1])
+
+        trs = []
+        for p0, p1 in runs:
+            start = p0*self.page_size
+            end = min(p1*self.page_size, self.size)
+            for a, c in self.node.split(self.addr+start, end-start):
+                trs.append((a-self.addr, c, self.node.submit_read(a, c)))
+
+        for offset, c, tr in trs:
+            d = tr.result()
+            if len(d) != c:
+                raise Exception("Short read at address 0x%x (%d of %d bytes)" % (self.addr+offset, len(d), c))
+            self.buf[offset:offset+c] = d
+            self.clean[offset:offset+c] = d
+
+        for p0, p1 in runs:
+            self.valid[p0:p1] = b'\x01'*(p1-p0)
+
+    def read(self, addr, count):
+        offset = self.offset(addr, count)
+        self.fetch(self.pages(offset, count))
+        return bytes(self.buf[offset:offset+count])
+
+    def read_into(self, addr, buf):
+        buf = memoryview(buf).cast('B')
+        offset = self.offset(addr, len(buf))
+        self.fetch(self.pages(offset, len(buf)))
+        buf[:] = self.buf[offset:offset+len(buf)]
+        return len(buf)
+
+    def write(self, addr, data):
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+        data = memoryview(data).cast('B')
+        count = len(data)
+        offset = self.offset(addr, count)
+        if not count:
+            return 0
+
+        # only partially written pages need their old contents
+        pages = self.pages(offset, count)
+        partial = [p for p in sorted({pages[0], pages[-1]})
+            if p*self.page_size < offset or min((p+1)*self.page_size, self.size) > offset+count]
+        self.fetch(partial)
+        for p in pages:
+            self.valid[p] = 1
+
+        self.buf[offset:offset+count] = data
+        self.mark_dirty(offset, offset+count)
+        return count
+
+    def mark_dirty(self, start, end):
+        dirty = self.dirty
+        i = bisect.bisect_left(dirty, (start,))
+        # merge with a preceding range that touches this one
+        if i > 0 and dirty[i-1][1] >= start:
+            i -= 1
+            start = dirty[i][0]
+        j = i
+        while j < len(dirty) and dirty[j][0] <= end:
+            end = max(end, dirty[j][1])
+            j += 1
+        dirty[i:j] = [(start, end)]
+
+    def changed(self, start, end):
+        # ranges in [start, end) that differ from the device contents;
+        # equal pages are skipped with one compare each, and differing
+        # pages are narrowed down a block at a time before looking at
+        # single bytes
+        buf, clean = self.buf, self.clean
+        block = 64
+        ranges = []
+
+        for p in self.pages(start, end-start):
+            p0 = max(p*self.page_size, start)
+            p1 = min((p+1)*self.page_size, end)
+            if bytes(buf[p0:p1]) == bytes(clean[p0:p1]):
+                continue
+
+            for b0 in range(p0, p1, block):
+                b1 = min(b0+block, p1)
+                if bytes(buf[b0:b1]) == bytes(clean[b0:b1]):
+                    continue
+                for k in range(b0, b1):
+                    if buf[k] == clean[k]:
+                        continue
+                    if ranges and ranges[-1][1] == k:
+                        ranges[-1] = (ranges[-1][0], k+1)
+                    else:
+                        ranges.append((k, k+1))
+
+        return ranges
+
+    def view(self, addr=None, count=None, writable=True):
+        # memoryview of the local copy; changes made through a writable
+        # view are picked up by the next flush()
+        if addr is None:
+            addr = self.addr
+        if count is None:
+            count = self.size-(addr-self.addr)
+        offset = self.offset(addr, count)
+        pages = self.pages(offset, count)
+        self.fetch(pages)
+        mv = memoryview(self.buf)[offset:offset+count]
+        if not writable:
+            return mv.toreadonly()
+        self.exposed.update(pages)
+        return mv
+
+    def flush(self):
+        for p in sorted(self.exposed):
+            for start, end in self.changed(p*self.page_size, min((p+1)*self.page_size, self.size)):
+                self.mark_dirty(start, end)
+
+        if not self.dirty:
+            return 0
+
+        ranges = [self.dirty[0]]
+        for start, end in self.dirty[1:]:
+            prev = ranges[-1]
+            if start-prev[1] <= self.merge_gap and all(self.valid[p] for p in self.pages(prev[1], start-prev[1])):
+                ranges[-1] = (prev[0], end)
+            else:
+                ranges.append((start, end))
+
+        buf = memoryview(self.buf)
+        trs = []
+        for start, end in ranges:
+            for a, c in self.node.split(self.addr+start, end-start):
+                offset = a-self.addr
+                trs.append((a, c, self.node.submit_write(a, buf[offset:offset+c])))
+
+        for a, c, tr in trs:
+            n = tr.result()
+            if n != c:
+                raise Exception("Short write at address 0x%x (%d of %d bytes)" % (a, n, c))
+
+        count = 0
+        for start, end in ranges:
+            self.clean[start:end] = self.buf[start:end]
+            count += end-start
+        self.dirty = []
+        return count
+
+    def invalidate(self, addr=None, count=None):
+        # drop cached pages so they are read again; changes not yet
+        # flushed in those pages are lost
+        if addr is None:
+            addr = self.addr
+        if count is None:
+            count = self.size-(addr-self.addr)
+        pages = self.pages(self.offset(addr, count), count)
+
+        start = pages[0]*self.page_size
+        end = min((pages[-1]+1)*self.page_size, self.size)
+
+        dirty = []
+        for s, e in self.dirty:
+            if s < start:
+                dirty.append((s, min(e, start)))
+            if e > end:
+                dirty.append((max(s, end), e))
+        self.dirty = dirty
+
+        for p in pages:
+            self.valid[p] = 0
+            self.exposed.discard(p)
+
+    def default_dtype(self):
+        return self.node.default_dtype()
+
+    # word access, as on MemoryNode
+    read_words = MemoryNode.read_words
+    read_dwords = MemoryNode.read_dwords
+    read_qwords = MemoryNode.read_qwords
+    read_byte = MemoryNode.read_byte
+    read_word = MemoryNode.read_word
+    read_dword = MemoryNode.read_dword
+    read_qword = MemoryNode.read_qword
+    read_array = MemoryNode.read_array
+    write_words = MemoryNode.write_words
+    write_dwords = MemoryNode.write_dwords
+    write_qwords = MemoryNode.write_qwords
+    write_byte = MemoryNode.write_byte
+    write_word = MemoryNode.write_word
+    write_dword = MemoryNode.write_dword
+    write_qword = MemoryNode.write_qword
+    write_array = MemoryNode.write_array
@@ -22,12 +22,28 @@ THE SOFTWARE.
 
 """
 
+import array
+import asyncio
+import collections
+import contextlib
+import itertools
+import os
 import struct
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 from . import packet
+from .batch import Batch
 
 node_types = []
 
+# ID requests in flight when identifying a level of the tree
+identify_window = 32
+
 
 def register(cls, ntype, prefix=16):
     prefix = min(max(int(prefix), 1), 16)
@@ -38,23 +54,125 @@ def register(cls, ntype, prefix=16):
     node_types.append((cls, ntype, prefix))
 
 
-def enumerate_interface(interface, path=(), parent=None):
-    node = Node()
-    node.interface = interface
-    node.path = path
-    node.parent = parent
-    node.init()
-
+def find_node_type(ntype):
     match_cls = None
     match_prefix = 0
 
     for nt in node_types:
-        if node.ntype & (0xffff0000 >> nt[2]) == nt[1] and nt[2] > match_prefix:
+        if ntype & (0xffff0000 >> nt[2]) == nt[1] and nt[2] > match_prefix:
             match_cls = nt[0]
             match_prefix = nt[2]
 
+    return match_cls
+
+
+@contextlib.contextmanager
+def override_window(interface, window):
+    # temporarily use a different interface window, None keeps the current one
+    if window is None:
+        yield
+        return
+
+    win = interface.window
+    interface.window = window
+    try:
+        yield
+    finally:
+        interface.window = win
+
+
+def identify(interface, paths, window=None):
+    # ID requests for all paths; unless a window is passed, up to
+    # identify_window are in flight even on a window 1 interface, as they
+    # have no side effects and the responses are small
+    if window is None:
+        window = max(interface.window, min(len(paths), identify_window))
+    with override_window(interface, window):
+        trs = [(p, interface.submit(packet.IDRequestPacket(path=p))) for p in paths]
+        return {p: tr.result() for p, tr in trs}
+
+
+def identify_tree(interface, path=(), ids=None, window=None):
+    # collect ID responses for the subtree at path, breadth first, one
+    # pipelined pass per level of the tree
+    ids = dict(ids) if ids else {}
+    level = [tuple(path)]
+
+    while level:
+        ids.update(identify(interface, [p for p in level if p not in ids], window))
+
+        level = [q for p in level for q in child_paths(p, ids[p])]
+
+    return ids
+
+
+def child_paths(path, id_pkt):
+    # downstream port paths of a switch, from its ID response
+    payload = id_pkt.payload
+    cls = find_node_type(struct.unpack_from('<H', payload, 0)[0])
+    if cls is not None and issubclass(cls, SwitchNode):
+        return [tuple(path)+(k,) for k in range(payload[3])]
+    return []
+
+
+def enumerate_interface(interface, path=(), parent=None, ids=None, lazy=False):
+    # ids maps paths to ID response packets; the subtree is identified
+    # first if it is not already covered.  With lazy, only this node is
+    # identified and switch ports are probed when first accessed.
+    if ids is None or path not in ids:
+        if lazy:
+            ids = dict(ids) if ids else {}
+            ids[path] = interface.transact(packet.IDRequestPacket(path=path))
+        else:
+            ids = identify_tree(interface, path, ids)
+
+    node = Node()
+    node.interface = interface
+    node.path = path
+    node.parent = parent
+    node.init(ids[path])
+
+    match_cls = find_node_type(node.ntype)
+
+    if match_cls is not None:
+        return match_cls(node).init(ids=ids, lazy=lazy)
+
+    return node
+
+
+# memoryview/array formats for NumPy style dtype names, used without NumPy
+array_formats = {
+    'i1': 'b', 'u1': 'B', 'i2': 'h', 'u2': 'H', 'i4': 'i', 'u4': 'I',
+    'i8': 'q', 'u8': 'Q', 'f4': 'f', 'f8': 'd'
+}
+
+
+def array_format(dtype):
+    fmt = str(dtype).lstrip('<=|')
+    fmt = array_formats.get(fmt, fmt)
+    if fmt not in array_formats.values():
+        raise Exception("Unsupported dtype %r (little endian integer or float only without NumPy)" % (dtype,))
+    return fmt
+
+
+def collect_ids(node):
+    ids = {tuple(node.path): node.id_pkt}
+    for n in node.children:
+        ids.update(collect_ids(n))
+    return ids
+
+
+async def enumerate_interface_async(interface, path=(), parent=None):
+    node = Node()
+    node.interface = interface
+    node.path = path
+    node.parent = parent
+    await node.init_async()
+
+    match_cls = find_node_type(node.ntype)
+
     if match_cls is not None:
-        return match_cls(node).init()
+        return await match_cls(node).init_async()
 
     return node
 
@@ -80,21 +198,41 @@ class Node(object):
             self.children = obj.children
             self.id_pkt = obj.id_pkt
 
-    def init(self, id_pkt=None):
+    def init(self, id_pkt=None, ids=None, lazy=False):
         if id_pkt is not None:
             self.id_pkt = id_pkt
 
         if self.id_pkt is None:
-            self.interface.send(packet.IDRequestPacket(path=self.path))
-            self.id_pkt = self.interface.receive()
+            self.id_pkt = self.interface.transact(packet.IDRequestPacket(path=self.path))
 
+        self.parse_id()
+
+        return self
+
+    async def init_async(self, id_pkt=None):
+        if id_pkt is not None:
+            self.id_pkt = id_pkt
+
+        if self.id_pkt is None:
+            self.id_pkt = await self.interface.transact(packet.IDRequestPacket(path=self.path))
+
+        self.parse_id()
+
+        return self
+
+    def parse_id(self):
         self.ntype = struct.unpack_from('<H', self.id_pkt.payload, 0)[0]
         self.name = struct.unpack_from('16s', self.id_pkt.payload, 16)[0].rstrip(b'\x00').decode('utf-8')
 
         if len(self.id_pkt.payload) > 32:
             self.ext_str = struct.unpack_from('16s', self.id_pkt.payload, 48)[0].rstrip(b'\x00').decode('utf-8')
 
-        return self
+    def batch(self, window=None):
+        return Batch(self.interface, self, window)
+
+    def write_done(self, addr, data):
+        # called by Batch when a write to this node has completed
+        pass
 
     def get_by_path(self, path):
         if type(path) is str:
@@ -182,6 +320,9 @@ class Node(object):
 
 class SwitchNode(Node):
     def __init__(self, obj=None):
+        self.ids = None
+        self._children = []
+
         super().__init__(obj)
 
         self.up_ports = 0
@@ -190,21 +331,74 @@ class SwitchNode(Node):
         if isinstance(obj, SwitchNode):
             self.up_ports = obj.up_ports
             self.down_ports = obj.down_ports
+            self.ids = obj.ids
 
-    def init(self, id_pkt=None):
+    def init(self, id_pkt=None, ids=None, lazy=False):
         super().init(id_pkt)
 
-        self.up_ports, self.down_ports = struct.unpack_from('BB', self.id_pkt.payload, 2)
+        if lazy:
+            # placeholders, filled in by probe()
+            self.ids = ids
+            self._children.extend([None]*self.down_ports)
+        else:
+            for p in range(self.down_ports):
+                self._children.append(enumerate_interface(self.interface, self.path+(p,), self, ids))
+
+        return self
+
+    @property
+    def children(self):
+        if None in self._children:
+            self.probe()
+        return self._children
+
+    @children.setter
+    def children(self, value):
+        self._children = value
+
+    def probe(self, ports=None):
+        # identify not yet enumerated ports, pipelined up to the window
+        if ports is None:
+            ports = range(len(self._children))
+        ports = [p for p in ports if self._children[p] is None]
+        if not ports:
+            return
+
+        ids = dict(self.ids) if self.ids else {}
+        ids.update(identify(self.interface, [self.path+(p,) for p in ports if self.path+(p,) not in ids]))
+
+        for p in ports:
+            self._children[p] = enumerate_interface(self.interface, self.path+(p,), self, ids, True)
 
-        for p in range(self.down_ports):
-            self.children.append(enumerate_interface(self.interface, self.path+(p,), self))
+    def __getitem__(self, key):
+        if type(key) is slice:
+            self.probe(range(len(self._children))[key])
+        else:
+            self.probe([range(len(self._children))[key]])
+        return self._children[key]
+
+    def __len__(self):
+        return len(self._children)
+
+    async def init_async(self, id_pkt=None):
+        await super().init_async(id_pkt)
+
+        self.children.extend(await asyncio.gather(*(
+            enumerate_interface_async(self.interface, self.path+(p,), self) for p in range(self.down_ports))))
 
         return self
 
+    def parse_id(self):
+        super().parse_id()
+
+        self.up_ports, self.down_ports = struct.unpack_from('BB', self.id_pkt.payload, 2)
+
 register(SwitchNode, 0x0100, 8)
 
 
 class MemoryNode(Node):
+    chunk_window = 16
+
     def __init__(self, obj=None):
         super().__init__(obj)
 
@@ -220,36 +414,104 @@ class MemoryNode(Node):
             self.count_width = obj.count_width
 
         self.byte_addr_width = self.addr_width+((self.word_size-1)//8).bit_length()
+        self.init_templates()
 
-    def init(self, id_pkt=None):
-        super().init(id_pkt)
+    def parse_id(self):
+        super().parse_id()
 
         self.addr_width, self.data_width, self.word_size, self.count_width = struct.unpack_from('<HHHH', self.id_pkt.payload, 2)
         self.byte_addr_width = self.addr_width+((self.word_size-1)//8).bit_length()
-
-        return self
-
-    def read(self, addr, count):
-        pkt = packet.ReadRequestPacket()
-        pkt.path = self.path
+        self.init_templates()
+
+    def init_templates(self):
+        # prebuilt request encodings and response field struct; requests
+        # stay packet objects rather than sharing one packed buffer, as the
+        # interface holds each request (and UDP rebuilds it to retransmit)
+        # until its response arrives
+        self.read_template = packet.MemoryRequestTemplate(self.path, 0x10, self.byte_addr_width, self.count_width)
+        self.write_template = packet.MemoryRequestTemplate(self.path, 0x12, self.byte_addr_width, self.count_width)
+        self.resp_struct = packet.field_struct((self.byte_addr_width+7)//8, (self.count_width+7)//8)
+
+    def build_read(self, addr, count):
+        pkt = packet.ReadRequestPacket(path=self.path)
         pkt.addr = addr
-        pkt.data = b''
         pkt.count = count
         pkt.addr_width = self.byte_addr_width
         pkt.count_width = self.count_width
-        self.interface.send(pkt)
-        pkt = self.interface.receive()
+        pkt.template = self.read_template
+        return pkt
+
+    def parse_read(self, pkt):
+        if self.resp_struct:
+            return bytes(pkt.payload[self.resp_struct.size:])
         pkt.addr_width = self.byte_addr_width
         pkt.count_width = self.count_width
         pkt.parse()
-        return pkt.data
+        return bytes(pkt.data)
+
+    def max_count(self):
+        # largest count that fits in the count field and in one packet,
+        # including path, two byte rpath tag, header tags and ptype
+        count = 2**self.count_width-1
+        if self.interface.max_packet_size:
+            hdr = len(self.path)+5+(self.byte_addr_width+7)//8+(self.count_width+7)//8
+            count = min(count, self.interface.max_packet_size-hdr)
+        step = max(self.data_width//8, 1)
+        if count > step:
+            count -= count % step
+        return max(count, 1)
+
+    def split(self, addr, count):
+        step = self.max_count()
+        return [(addr+offset, min(step, count-offset)) for offset in range(0, count, step)]
+
+    def transfer_window(self, count, window=None):
+        # requests in flight for a transfer split into count chunks; chunks
+        # are pipelined up to chunk_window even on a window 1 interface
+        if window is None:
+            window = max(self.interface.window, min(count, self.chunk_window))
+        return window
+
+    def submit_read(self, addr, count):
+        return self.interface.submit(self.build_read(addr, count), self.parse_read)
+
+    def read(self, addr, count, window=None):
+        chunks = self.split(addr, count)
+        if len(chunks) <= 1:
+            return self.submit_read(addr, count).result()
+
+        data = bytearray(count)
+        self.read_into(addr, data, window)
+        return bytes(data)
+
+    def read_into(self, addr, buf, window=None):
+        buf = memoryview(buf).cast('B')
+        chunks = self.split(addr, len(buf))
+        with override_window(self.interface, self.transfer_window(len(chunks), window)):
+            trs = [self.submit_read(a, c) for a, c in chunks]
+            for tr, (a, c) in zip(trs, chunks):
+                d = tr.result()
+                if len(d) != c:
+                    raise Exception("Short read at address 0x%x (%d of %d bytes)" % (a, len(d), c))
+                buf[a-addr:a-addr+c] = d
+        return len(buf)
+
+    async def read_async(self, addr, count):
+        chunks = self.split(addr, count)
+        if len(chunks) <= 1:
+            return await self.interface.transact(self.build_read(addr, count), self.parse_read)
+
+        lst = await asyncio.gather(*(self.interface.transact(self.build_read(a, c), self.parse_read) for a, c in chunks))
+        for d, (a, c) in zip(lst, chunks):
+            if len(d) != c:
+                raise Exception("Short read at address 0x%x (%d of %d bytes)" % (a, len(d), c))
+        return b''.join(lst)
 
     def read_words(self, addr, count, ws=2):
         data = self.read(addr, count*ws)
-        words = []
-        for k in range(count):
-            words.append(int.from_bytes(data[ws*k:ws*(k+1)], 'little'))
-        return words
+        if ws in (1, 2, 4, 8) and len(data) == count*ws and sys.byteorder == 'little':
+            return memoryview(data).cast(array_format('u%d' % ws)).tolist()
+        return [int.from_bytes(data[k:k+ws], 'little') for k in range(0, len(data), ws)]
 
     def read_dwords(self, addr, count):
         return self.read_words(addr, count, 4)
@@ -257,6 +519,130 @@ class MemoryNode(Node):
     def read_qwords(self, addr, count):
         return self.read_words(addr, count, 8)
 
+    def default_dtype(self):
+        ws = self.data_width//8
+        return 'u%d' % ws if ws in (1, 2, 4, 8) else 'u1'
+
+    def read_array(self, addr, count, dtype=None):
+        # count elements of dtype (NumPy dtype or name like 'u4'), little
+        # endian unless the dtype says otherwise; returns an ndarray, or
+        # a memoryview without NumPy
+        if dtype is None:
+            dtype = self.default_dtype()
+
+        if np is not None:
+            dtype = np.dtype(dtype)
+            if dtype.byteorder == '=':
+                dtype = dtype.newbyteorder('<')
+            data = np.empty(count, dtype)
+            self.read_into(addr, data)
+            return data
+
+        fmt = array_format(dtype)
+        data = array.array(fmt, bytes(count*array.array(fmt).itemsize))
+        self.read_into(addr, data)
+        if sys.byteorder != 'little':
+            data.byteswap()
+        return memoryview(data)
+
+    def iter_read(self, addr, length, chunk=65536, depth=2):
+        # yields memoryviews of successive chunks of a region; the next
+        # depth chunks are already requested while the caller handles one
+        pending = collections.deque()
+        end = addr+length
+
+        try:
+            while pending or addr < end:
+                while addr < end and len(pending) <= depth:
+                    count = min(chunk, end-addr)
+                    pending.append((addr, count, [(a, c, self.submit_read(a, c)) for a, c in self.split(addr, count)]))
+                    addr += count
+
+                base, count, trs = pending[0]
+                buf = bytearray(count)
+                for a, c, tr in trs:
+                    d = tr.result()
+                    if len(d) != c:
+                        raise Exception("Short read at address 0x%x (%d of %d bytes)" % (a, len(d), c))
+                    buf[a-base:a-base+c] = d
+                pending.popleft()
+
+                yield memoryview(buf)
+        finally:
+            # abandoned early, drop requests still in flight
+            for base, count, trs in pending:
+                for a, c, tr in trs:
+                    self.interface.cancel(tr)
+
+    def dump_to_file(self, addr, length, path, chunk=65536, depth=2):
+        # stream a region to a file name, a binary file object or a
+        # writable buffer such as an np.memmap, one chunk in memory at a
+        # time; returns the number of bytes written
+        if isinstance(path, (str, bytes, os.PathLike)):
+            with open(path, 'wb') as f:
+                return self.dump_to_file(addr, length, f, chunk, depth)
+
+        if hasattr(path, 'write'):
+            write = path.write
+        else:
+            out = memoryview(path).cast('B')
+            if len(out) < length:
+                raise Exception("Buffer too small (%d of %d bytes)" % (len(out), length))
+            offset = 0
+
+            def write(data):
+                nonlocal offset
+                out[offset:offset+len(data)] = data
+                offset += len(data)
+
+        done = 0
+        for data in self.iter_read(addr, length, chunk, depth):
+            write(data)
+            done += len(data)
+
+        if hasattr(path, 'flush'):
+            path.flush()
+
+        return done
+
+    def load_from_file(self, addr, path, chunk=65536, depth=2):
+        # counterpart of dump_to_file, streams a file name, binary file
+        # object or buffer into a region with up to depth chunks of writes
+        # in flight; returns the number of bytes written
+        if isinstance(path, (str, bytes, os.PathLike)):
+            with open(path, 'rb') as f:
+                return self.load_from_file(addr, f, chunk, depth)
+
+        if hasattr(path, 'read'):
+            chunks = iter(lambda: path.read(chunk), b'')
+        else:
+            buf = memoryview(path).cast('B')
+            chunks = (buf[k:k+chunk] for k in range(0, len(buf), chunk))
+
+        pending = collections.deque()
+        done = 0
+
+        try:
+            for data in itertools.chain(chunks, [None]):
+                if data is not None:
+                    data = memoryview(data)
+                    pending.append([(a, c, self.submit_write(a, data[a-addr:a-addr+c])) for a, c in self.split(addr, len(data))])
+                    addr += len(data)
+
+                while pending and (len(pending) > depth or data is None):
+                    for a, c, tr in pending[0]:
+                        n = tr.result()
+                        if n != c:
+                            raise Exception("Short write at address 0x%x (%d of %d bytes)" % (a, n, c))
+                        done += n
+                    pending.popleft()
+        finally:
+            for trs in pending:
+                for a, c, tr in trs:
+                    self.interface.cancel(tr)
+
+        return done
+
     def read_byte(self, addr):
         return self.read(addr, 1)[0]
 
@@ -269,27 +655,77 @@ class MemoryNode(Node):
     def read_qword(self, addr):
         return self.read_qwords(addr, 1)[0]
 
-    def write(self, addr, data):
-        pkt = packet.WriteRequestPacket()
-        pkt.path = self.path
+    def build_write(self, addr, data):
+        pkt = packet.WriteRequestPacket(path=self.path)
         pkt.addr = addr
         pkt.data = data
         pkt.count = len(data)
         pkt.addr_width = self.byte_addr_width
         pkt.count_width = self.count_width
-        self.interface.send(pkt)
-        pkt = self.interface.receive()
+        pkt.template = self.write_template
+        return pkt
+
+    def parse_write(self, pkt):
+        if self.resp_struct:
+            return self.resp_struct.unpack_from(pkt.payload)[1]
         pkt.addr_width = self.byte_addr_width
         pkt.count_width = self.count_width
         pkt.parse()
         return pkt.count
 
+    def submit_write(self, addr, data):
+        return self.interface.submit(self.build_write(addr, data), self.parse_write)
+
+    def write(self, addr, data, window=None):
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+        chunks = self.split(addr, len(data))
+        if len(chunks) <= 1:
+            return self.submit_write(addr, data).result()
+
+        data = memoryview(data)
+        with override_window(self.interface, self.transfer_window(len(chunks), window)):
+            trs = [self.submit_write(a, data[a-addr:a-addr+c]) for a, c in chunks]
+            return sum(tr.result() for tr in trs)
+
+    async def write_async(self, addr, data):
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+        chunks = self.split(addr, len(data))
+        if len(chunks) <= 1:
+            return await self.interface.transact(self.build_write(addr, data), self.parse_write)
+
+        data = memoryview(data)
+        lst = await asyncio.gather(*(self.interface.transact(self.build_write(a, data[a-addr:a-addr+c]), self.parse_write) for a, c in chunks))
+        return sum(lst)
+
     def write_words(self, addr, data, ws=2):
-        words = data
-        data = b''
-        for w in words:
-            data += w.to_bytes(ws, 'little')
-        return int(self.write(addr, data)/ws)
+        data = b''.join(w.to_bytes(ws, 'little') for w in data)
+        return self.write(addr, data)//ws
+
+    def write_array(self, addr, data, dtype=None):
+        # counterpart of read_array, data is sent straight from the
+        # array's buffer; returns the number of elements written
+        if np is not None:
+            if dtype is None and not isinstance(data, np.ndarray):
+                dtype = self.default_dtype()
+            if dtype is not None:
+                dtype = np.dtype(dtype)
+                if dtype.byteorder == '=':
+                    dtype = dtype.newbyteorder('<')
+            data = np.ascontiguousarray(data, dtype)
+            if data.dtype.byteorder == '=' and sys.byteorder != 'little':
+                data = data.astype(data.dtype.newbyteorder('<'))
+            return self.write(addr, memoryview(data).cast('B'))//data.itemsize
+
+        if not isinstance(data, (bytes, bytearray, memoryview, array.array)):
+            data = array.array(array_format(dtype or self.default_dtype()), data)
+        data = memoryview(data)
+        if data.itemsize > 1 and sys.byteorder != 'little':
+            data = array.array(data.format, data.tobytes())
+            data.byteswap()
+            data = memoryview(data)
+        return self.write(addr, data.cast('B'))//data.itemsize
 
     def write_dwords(self, addr, data):
         return self.write_words(addr, data, 4)
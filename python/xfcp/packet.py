@@ -34,6 +34,28 @@ def register(cls, ptype):
     packet_types[ptype] = cls
 
 
+def parse_header(data):
+    # split a packet into path, rpath, ptype and payload, copying the
+    # payload once; path and rpath bytes are always below 0xFE, so the
+    # first 0xFF marks the end of the header
+    if not isinstance(data, bytes):
+        data = bytes(data)
+
+    i = data.index(0xFF)
+    j = data.find(0xFE, 0, i)
+
+    if j < 0:
+        path = tuple(data[:i])
+        rpath = ()
+    else:
+        if data.find(0xFE, j+1, i) >= 0:
+            raise Exception("Invalid packet header")
+        path = tuple(data[:j])
+        rpath = tuple(data[j+1:i])
+
+    return path, rpath, data[i+1], data[i+2:]
+
+
 def parse(data):
     pkt = Packet()
     pkt.parse(data)
@@ -44,6 +66,79 @@ def parse(data):
     return pkt
 
 
+# 0xFF delimiter followed by ptype, for each ptype
+_delim = [bytes((0xFF, k)) for k in range(256)]
+
+
+def build_header(path, rpath, ptype):
+    if rpath:
+        return b''.join((bytes(path), b'\xfe', bytes(rpath), _delim[ptype]))
+    return bytes(path)+_delim[ptype]
+
+
+# address and count fields, for byte aligned widths struct can handle
+_field_structs = {}
+_struct_codes = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+
+def field_struct(aw, cw):
+    key = (aw, cw)
+    st = _field_structs.get(key)
+    if st is None:
+        if aw in _struct_codes and cw in _struct_codes:
+            st = struct.Struct('<'+_struct_codes[aw]+_struct_codes[cw])
+        else:
+            st = False
+        _field_structs[key] = st
+    return st
+
+
+class MemoryRequestTemplate(object):
+    """
+    Precomputed encoding of memory requests to one node
+
+    Holds the path bytes and a struct covering the header delimiters,
+    ptype, address and count, so building a request with the usual two
+    byte rpath tag is a single pack.
+    """
+
+    __slots__ = ('path', 'ptype', 'addr_width', 'count_width', 'prefix', 'tail', 'full')
+
+    def __init__(self, path, ptype, addr_width, count_width):
+        self.path = tuple(path)
+        self.ptype = ptype
+        self.addr_width = addr_width
+        self.count_width = count_width
+        self.prefix = bytes(path)
+
+        aw = (addr_width+7)//8
+        cw = (count_width+7)//8
+
+        if aw in _struct_codes and cw in _struct_codes:
+            codes = _struct_codes[aw]+_struct_codes[cw]
+            self.tail = struct.Struct('<BB'+codes)
+            self.full = struct.Struct('<%dsBBBBB' % len(self.prefix)+codes)
+        else:
+            self.tail = None
+            self.full = None
+
+    def build(self, rpath, addr, count, data=b''):
+        if self.full is not None and len(rpath) == 2:
+            hdr = self.full.pack(self.prefix, 0xFE, rpath[0], rpath[1], 0xFF, self.ptype, addr, count)
+            return hdr+data if data else hdr
+
+        if self.tail is not None:
+            tail = self.tail.pack(0xFF, self.ptype, addr, count)
+        else:
+            aw = (self.addr_width+7)//8
+            cw = (self.count_width+7)//8
+            tail = _delim[self.ptype]+addr.to_bytes(aw, 'little')+count.to_bytes(cw, 'little')
+
+        if rpath:
+            return b''.join((self.prefix, b'\xfe', bytes(rpath), tail, data))
+        return b''.join((self.prefix, tail, data))
+
+
 class Packet(object):
     def __init__(self, payload=b'', path=(), rpath=(), ptype=0):
         self.payload = payload
@@ -58,53 +153,15 @@ class Packet(object):
             self.ptype = payload.ptype
 
     def build(self):
-        data = bytearray()
-
-        for p in self.path:
-            data.append(p)
-
-        if len(self.rpath) > 0:
-            data.append(0xFE)
-            for p in self.rpath:
-                data.append(p)
-
-        data.append(0xFF)
-        data.append(self.ptype)
-
-        data.extend(self.payload)
-
-        return bytes(data)
+        return build_header(self.path, self.rpath, self.ptype)+bytes(self.payload)
 
     def parse(self, data):
-        i = 0
-
-        data = bytearray(data)
-
-        self.path = []
-        self.rpath = []
-
-        while i < len(data) and data[i] < 0xFE:
-            self.path.append(data[i])
-            i += 1
-
-        if data[i] == 0xFE:
-            i += 1
-            while i < len(data) and data[i] < 0xFE:
-                self.rpath.append(data[i])
-                i += 1
-
-        assert data[i] == 0xFF
-        i += 1
-
-        self.ptype = data[i]
-        i += 1
-
-        self.payload = bytes(data[i:])
+        self.path, self.rpath, self.ptype, self.payload = parse_header(data)
 
     def __eq__(self, other):
         if isinstance(other, Packet):
-            return (self.path == other.path and
-                self.rpath == other.rpath and
+            return (tuple(self.path) == tuple(other.path) and
+                tuple(self.rpath) == tuple(other.rpath) and
                 self.ptype == other.ptype and
                 self.payload == other.payload)
         return False
@@ -141,6 +198,7 @@ class MemoryAccessPacket(Packet):
         self.data = b''
         self.addr_width = 32
         self.count_width = 16
+        self.template = None
 
         if isinstance(payload, MemoryAccessPacket):
             self.addr = payload.addr
@@ -148,12 +206,22 @@ class MemoryAccessPacket(Packet):
             self.data = payload.data
             self.addr_width = payload.addr_width
             self.count_width = payload.count_width
+            self.template = payload.template
 
     def build(self):
         aw = (self.addr_width+7)//8
         cw = (self.count_width+7)//8
-        self.payload = self.addr.to_bytes(aw, 'little')
-        self.payload += self.count.to_bytes(cw, 'little')
+
+        if self.template is not None:
+            data = self.template.build(self.rpath, self.addr, self.count, self.data)
+            self.payload = data[len(data)-aw-cw-len(self.data):]
+            return data
+
+        st = field_struct(aw, cw)
+        if st:
+            self.payload = st.pack(self.addr, self.count)
+        else:
+            self.payload = self.addr.to_bytes(aw, 'little')+self.count.to_bytes(cw, 'little')
         self.payload += self.data
 
         return super().build()
@@ -164,8 +232,12 @@ class MemoryAccessPacket(Packet):
 
         aw = (self.addr_width+7)//8
         cw = (self.count_width+7)//8
-        self.addr = int.from_bytes(self.payload[0:aw], 'little')
-        self.count = int.from_bytes(self.payload[aw:aw+cw], 'little')
+        st = field_struct(aw, cw)
+        if st and len(self.payload) >= aw+cw:
+            self.addr, self.count = st.unpack_from(self.payload)
+        else:
+            self.addr = int.from_bytes(self.payload[0:aw], 'little')
+            self.count = int.from_bytes(self.payload[aw:aw+cw], 'little')
         self.data = self.payload[aw+cw:]
 
     def __repr__(self):
@@ -0,0 +1,234 @@
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import collections
+import functools
+import os
+import selectors
+import socket
+import threading
+
+from . import packet
+from .interface import ThreadedInterface
+
+
+class Proxy(object):
+    """
+    Shares one interface between many local clients
+
+    Clients send XFCP packets as datagrams over UDP (so the existing
+    UDPInterface works unchanged) or a Unix datagram socket.  Requests go
+    through a ThreadedInterface on the shared link.  The client's rpath is
+    taken off and kept here while the link tags the request with its own
+    two byte rpath, then put back on the response, so a client that tags
+    its requests with a two byte rpath (as UDPInterface does) sees packets
+    of the same size as on a direct link.  Clients with a shorter rpath
+    grow by up to three bytes and must leave that much room below
+    max_packet_size, for requests and responses alike; requests that do
+    not fit on the link are dropped.
+
+    Requests are queued per client and forwarded round robin with at most
+    window requests in flight, so a client flooding the link cannot
+    starve the others.  A request identical to one from the same client
+    that is still queued or in flight (i.e. a retransmit) is dropped, as
+    the response to the first one answers both.  Requests the device does
+    not answer within timeout are dropped and left to the client to retry.
+    """
+
+    # size of the rpath tag the link puts on each request
+    tag_length = 2
+
+    def __init__(self, interface, window=None, timeout=1.0, max_queue=256):
+        self.upstream = ThreadedInterface(interface, timeout)
+        if window is not None:
+            self.upstream.window = window
+        self.max_queue = max_queue
+
+        self.selector = selectors.DefaultSelector()
+        self.sockets = []
+        self.unix_paths = []
+
+        self.lock = threading.RLock()
+        self.queues = collections.OrderedDict()
+        # (client, request bytes) of everything queued or in flight
+        self.outstanding = set()
+        self.in_flight = 0
+        self.running = True
+
+        self.requests = 0
+        self.responses = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.oversize = 0
+        self.timeouts = 0
+
+    @property
+    def max_packet_size(self):
+        # largest packet the link carries, None if unlimited; also the
+        # limit for clients that tag requests with a two byte rpath
+        return self.upstream.max_packet_size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def listen(self, sock):
+        sock.setblocking(False)
+        self.sockets.append(sock)
+        self.selector.register(sock, selectors.EVENT_READ)
+        return sock
+
+    def listen_udp(self, host='127.0.0.1', port=14000):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((host, port))
+        return self.listen(sock)
+
+    def listen_unix(self, path):
+        # clients must bind their own socket to receive responses
+        if os.path.exists(path):
+            os.unlink(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(path)
+        self.unix_paths.append(path)
+        return self.listen(sock)
+
+    def close(self):
+        self.running = False
+        for sock in self.sockets:
+            self.selector.unregister(sock)
+            sock.close()
+        self.sockets = []
+        for path in self.unix_paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        self.unix_paths = []
+        self.upstream.close()
+
+    def handle_datagram(self, sock, data, addr):
+        if not addr:
+            # unbound Unix socket, nowhere to send the response
+            self.dropped += 1
+            return
+
+        try:
+            path, rpath, ptype, payload = packet.parse_header(data)
+        except Exception:
+            # malformed packet
+            self.dropped += 1
+            return
+
+        client = (sock, addr)
+        key = (client, bytes(data))
+
+        with self.lock:
+            self.requests += 1
+
+            # size on the link, with our tag in place of the client's rpath
+            size = len(data)-len(rpath)+self.tag_length+(0 if rpath else 1)
+            if self.max_packet_size and size > self.max_packet_size:
+                self.oversize += 1
+                return
+
+            if key in self.outstanding:
+                self.duplicates += 1
+                return
+
+            q = self.queues.get(client)
+            if q is None:
+                q = self.queues[client] = collections.deque()
+            if len(q) >= self.max_queue:
+                self.dropped += 1
+                return
+            q.append((key, rpath, packet.Packet(payload, path, (), ptype)))
+            self.outstanding.add(key)
+
+        self.schedule()
+
+    def schedule(self):
+        # forward queued requests round robin while the window allows
+        with self.lock:
+            while self.queues and self.in_flight < max(self.upstream.window, 1):
+                client, q = next(iter(self.queues.items()))
+                key, rpath, pkt = q.popleft()
+                if q:
+                    self.queues.move_to_end(client)
+                else:
+                    del self.queues[client]
+
+                self.in_flight += 1
+                try:
+                    fut = self.upstream.submit(pkt)
+                except Exception:
+                    self.in_flight -= 1
+                    self.outstanding.discard(key)
+                    self.dropped += 1
+                    continue
+                fut.add_done_callback(functools.partial(self.complete, key, rpath))
+
+    def complete(self, key, rpath, fut):
+        # runs on the I/O thread of the upstream interface
+        client = key[0]
+
+        with self.lock:
+            self.in_flight -= 1
+            self.outstanding.discard(key)
+
+        try:
+            pkt = fut.result()
+        except Exception:
+            with self.lock:
+                self.timeouts += 1
+        else:
+            with self.lock:
+                self.responses += 1
+            sock, addr = client
+            try:
+                sock.sendto(packet.Packet(pkt.payload, pkt.path, rpath, pkt.ptype).build(), addr)
+            except OSError:
+                # client went away
+                pass
+
+        if self.running:
+            self.schedule()
+
+    def poll(self, timeout=None):
+        for key, mask in self.selector.select(timeout):
+            sock = key.fileobj
+            while True:
+                try:
+                    data, addr = sock.recvfrom(65536)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    # e.g. ICMP port unreachable from a client that left
+                    continue
+                self.handle_datagram(sock, data, addr)
+
+    def serve_forever(self, poll_interval=0.5):
+        while self.running:
+            self.poll(poll_interval)
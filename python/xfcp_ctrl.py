@@ -24,10 +24,142 @@ THE SOFTWARE.
 """
 
 import argparse
+import json
+import os
+import sys
+import time
 
 import xfcp.interface
 import xfcp.node
 import xfcp.i2c_node
+from xfcp.batch import Batch
+
+# minimum requests in flight for --load, --dump and --verify
+stream_window = 16
+
+
+def count_packets(node, addr, length, chunk=65536):
+    return sum(len(node.split(a, min(chunk, addr+length-a))) for a in range(addr, addr+length, chunk))
+
+
+def format_rate(count, packets, dt):
+    dt = max(dt, 1e-9)
+    return "%d bytes in %.3f s, %.2f MB/s, %.0f packets/s" % (count, dt, count/dt/1e6, packets/dt)
+
+
+def script_command(n, cmd, params):
+    # returns (access, start); access is (path, start, end, write) for
+    # ordering against other commands, start(batch) queues the operations
+    # and returns a function producing the result fields
+    if cmd == 'id':
+        if len(params) != 1:
+            raise Exception("usage: id PATH")
+        n2 = n.get_by_path(params[0])
+        if n2 is None:
+            raise Exception("invalid path (%s)" % params[0])
+        result = {'id': n2.id_pkt.payload.hex(), 'type': type(n2).__name__, 'name': n2.name}
+        return None, lambda b: lambda: result
+
+    if cmd not in ('read', 'write', 'read_i2c', 'write_i2c'):
+        raise Exception("unknown command (%s)" % cmd)
+    if len(params) != 3:
+        raise Exception("usage: %s PATH ADDR %s" % (cmd, 'LEN' if cmd.startswith('read') else 'DATA'))
+
+    n2 = n.get_by_path(params[0])
+    if n2 is None:
+        raise Exception("invalid path (%s)" % params[0])
+
+    addr = int(params[1], 0)
+    write = cmd.startswith('write')
+    if write:
+        data = bytes.fromhex(params[2])
+    else:
+        count = int(params[2], 0)
+
+    if cmd.endswith('_i2c'):
+        if not isinstance(n2, xfcp.i2c_node.I2CNode):
+            raise Exception("not a I2CNode (%s)" % params[0])
+
+        # bus transactions are stateful, order against any access to the bus
+        access = (tuple(n2.path), 0, 256, write)
+
+        if write:
+            def start(b):
+                op = b.write_i2c(addr, data, node=n2)
+                return lambda: {'count': op.result()}
+        else:
+            def start(b):
+                op = b.read_i2c(addr, count, node=n2)
+                return lambda: {'data': op.result().hex()}
+
+        return access, start
+
+    if not isinstance(n2, xfcp.node.MemoryNode):
+        raise Exception("not a MemoryNode (%s)" % params[0])
+
+    if write:
+        access = (tuple(n2.path), addr, addr+len(data), True)
+
+        def start(b):
+            ops = [b.write(a, data[a-addr:a-addr+c], node=n2) for a, c in n2.split(addr, len(data))]
+            return lambda: {'count': sum(op.result() for op in ops)}
+    else:
+        access = (tuple(n2.path), addr, addr+count, False)
+
+        def start(b):
+            ops = [b.read(a, c, node=n2) for a, c in n2.split(addr, count)]
+            return lambda: {'data': b''.join(op.result() for op in ops).hex()}
+
+    return access, start
+
+
+def conflicts(a, b):
+    return a[0] == b[0] and a[1] < b[2] and b[1] < a[2] and (a[3] or b[3])
+
+
+def run_script(n, f, batch_size=256):
+    # one JSON object per command, in order; commands are batched and
+    # only wait for earlier ones that touch the same locations
+    interactive = f.isatty()
+    pending = []
+    b = Batch(n.interface)
+
+    def flush():
+        b.flush()
+        for record, finish, access in pending:
+            if finish is not None:
+                try:
+                    record.update(finish())
+                except Exception as ex:
+                    record['error'] = str(ex)
+            print(json.dumps(record), flush=True)
+        pending.clear()
+
+    for lineno, line in enumerate(f, 1):
+        fields = line.split('#', 1)[0].split()
+        if not fields:
+            continue
+
+        record = {'line': lineno, 'cmd': fields[0]}
+        if len(fields) > 1:
+            record['path'] = fields[1]
+
+        try:
+            access, start = script_command(n, fields[0], fields[1:])
+        except Exception as ex:
+            record['error'] = str(ex)
+            pending.append((record, None, None))
+        else:
+            if access is not None:
+                record['addr'] = access[1] if not fields[0].endswith('_i2c') else int(fields[2], 0)
+                if any(a is not None and conflicts(access, a) for r, fin, a in pending):
+                    flush()
+            pending.append((record, start(b), access))
+
+        if interactive or len(pending) >= batch_size:
+            flush()
+
+    flush()
 
 
 def main():
@@ -36,10 +168,16 @@ def main():
     parser.add_argument('-p', '--port', type=str, default='/dev/ttyUSB0', help="Port")
     parser.add_argument('-b', '--baud', type=int, default=115200, help="Baud rate")
     parser.add_argument('-H', '--host', type=str, help="Host (i.e. 192.168.1.128:14000)")
+    parser.add_argument('-w', '--window', type=int, default=1, help="Requests in flight")
+    parser.add_argument('--cache', action='store_true', help="Use the enumeration cache (ignored with --enum)")
     parser.add_argument('--enum', action='store_true', help="Enumerate modules")
     parser.add_argument('--id', type=str, nargs=1, metavar=('PATH',), action='append', help="Identify module")
     parser.add_argument('--write', type=str, nargs=3, metavar=('PATH', 'ADDR', 'DATA'), action='append', help="Memory write")
     parser.add_argument('--read', type=str, nargs=3, metavar=('PATH', 'ADDR', 'LEN'), action='append', help="Memory read")
+    parser.add_argument('--load', type=str, nargs=3, metavar=('PATH', 'ADDR', 'FILE'), action='append', help="Memory load from file")
+    parser.add_argument('--dump', type=str, nargs=4, metavar=('PATH', 'ADDR', 'LEN', 'FILE'), action='append', help="Memory dump to file")
+    parser.add_argument('--verify', type=str, nargs=3, metavar=('PATH', 'ADDR', 'FILE'), action='append', help="Memory compare with file")
+    parser.add_argument('--script', type=str, metavar='FILE', help="Run commands from file (- for stdin), JSON lines output")
     parser.add_argument('--write_i2c', type=str, nargs=3, metavar=('PATH', 'ADDR', 'DATA'), action='append', help="I2C write")
     parser.add_argument('--read_i2c', type=str, nargs=3, metavar=('PATH', 'ADDR', 'LEN'), action='append', help="I2C read")
     parser.add_argument('--enum_i2c', type=str, nargs=1, metavar=('PATH'), action='append', help="I2C enumerate")
@@ -54,12 +192,15 @@ def main():
 
     if host is not None:
         # Ethernet interface
-        intf = xfcp.interface.UDPInterface(host)
+        intf = xfcp.interface.UDPInterface(host, window=args.window)
     else:
         # serial interface
-        intf = xfcp.interface.SerialInterface(port, baud)
+        intf = xfcp.interface.SerialInterface(port, baud, window=args.window)
 
-    n = intf.enumerate()
+    if args.cache and not args.enum:
+        n = intf.enumerate(cache=True)
+    else:
+        n = intf.enumerate(lazy=not args.enum)
 
     do_enumerate = args.enum
 
@@ -105,6 +246,80 @@ def main():
             else:
                 print("Error: not a MemoryNode (%s)" % path)
 
+    if args.load is not None:
+        do_enumerate = False
+        for item in args.load:
+            path = item[0]
+            n2 = n.get_by_path(path)
+            if n2 is None:
+                print("Error: invalid path (%s)" % path)
+            elif isinstance(n2, xfcp.node.MemoryNode):
+                addr = int(item[1], 0)
+                start = time.perf_counter()
+                with xfcp.node.override_window(n2.interface, max(args.window, stream_window)):
+                    i = n2.load_from_file(addr, item[2])
+                dt = time.perf_counter()-start
+                print("Loaded %s to %s addr 0x%x: %s" % (item[2], '.'.join(str(x) for x in n2.path), addr,
+                    format_rate(i, count_packets(n2, addr, i), dt)))
+            else:
+                print("Error: not a MemoryNode (%s)" % path)
+
+    if args.dump is not None:
+        do_enumerate = False
+        for item in args.dump:
+            path = item[0]
+            n2 = n.get_by_path(path)
+            if n2 is None:
+                print("Error: invalid path (%s)" % path)
+            elif isinstance(n2, xfcp.node.MemoryNode):
+                addr = int(item[1], 0)
+                length = int(item[2], 0)
+                start = time.perf_counter()
+                with xfcp.node.override_window(n2.interface, max(args.window, stream_window)):
+                    i = n2.dump_to_file(addr, length, item[3])
+                dt = time.perf_counter()-start
+                print("Dumped %s addr 0x%x to %s: %s" % ('.'.join(str(x) for x in n2.path), addr, item[3],
+                    format_rate(i, count_packets(n2, addr, i), dt)))
+            else:
+                print("Error: not a MemoryNode (%s)" % path)
+
+    verify_failed = False
+
+    if args.verify is not None:
+        do_enumerate = False
+        for item in args.verify:
+            path = item[0]
+            n2 = n.get_by_path(path)
+            if n2 is None:
+                print("Error: invalid path (%s)" % path)
+            elif isinstance(n2, xfcp.node.MemoryNode):
+                addr = int(item[1], 0)
+                errors = 0
+                first = None
+                offset = 0
+                start = time.perf_counter()
+                with open(item[2], 'rb') as f, xfcp.node.override_window(n2.interface, max(args.window, stream_window)):
+                    length = os.fstat(f.fileno()).st_size
+                    for data in n2.iter_read(addr, length):
+                        ref = f.read(len(data))
+                        if data != ref:
+                            for k in range(len(data)):
+                                if data[k] != ref[k]:
+                                    errors += 1
+                                    if first is None:
+                                        first = addr+offset+k
+                        offset += len(data)
+                dt = time.perf_counter()-start
+                rate = format_rate(length, count_packets(n2, addr, length), dt)
+                if errors:
+                    verify_failed = True
+                    print("Verify %s addr 0x%x against %s: FAILED, %d bytes differ, first at 0x%x (%s)" % (
+                        '.'.join(str(x) for x in n2.path), addr, item[2], errors, first, rate))
+                else:
+                    print("Verify %s addr 0x%x against %s: OK (%s)" % ('.'.join(str(x) for x in n2.path), addr, item[2], rate))
+            else:
+                print("Error: not a MemoryNode (%s)" % path)
+
     if args.write_i2c is not None:
         do_enumerate = False
         for item in args.write_i2c:
@@ -140,17 +355,32 @@ def main():
                 print("Error: invalid path (%s)" % path)
             elif isinstance(n2, xfcp.i2c_node.I2CNode):
                 s = "%s I2C bus device addresses: " % path
+                with n2.batch() as b:
+                    status = []
+                    for k in range(128):
+                        b.read_i2c(k, 1)
+                        status.append(b.get_i2c_status())
                 for k in range(128):
-                    n2.read_i2c(k, 1)
-                    if n2.get_i2c_status() == 0:
+                    if status[k].result() == 0:
                         s += hex(k) + " "
                 print(s)
             else:
                 print("Error: not a I2CNode (%s)" % path)
 
+    if args.script is not None:
+        do_enumerate = False
+        if args.script == '-':
+            run_script(n, sys.stdin)
+        else:
+            with open(args.script) as f:
+                run_script(n, f)
+
     if do_enumerate:
         n.print_tree()
 
+    if verify_failed:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
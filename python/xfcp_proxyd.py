@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import argparse
+
+import xfcp.interface
+import xfcp.proxy
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--port', type=str, default='/dev/ttyUSB0', help="Port")
+    parser.add_argument('-b', '--baud', type=int, default=115200, help="Baud rate")
+    parser.add_argument('-H', '--host', type=str, help="Host (i.e. 192.168.1.128:14000)")
+    parser.add_argument('-w', '--window', type=int, default=1, help="Requests in flight on the link")
+    parser.add_argument('-t', '--timeout', type=float, default=1.0, help="Request timeout on the link")
+    parser.add_argument('-l', '--listen', type=str, default='127.0.0.1:14000', help="Local UDP address for clients")
+    parser.add_argument('-u', '--unix', type=str, help="Unix datagram socket path for clients")
+
+    args = parser.parse_args()
+
+    port = args.port
+    baud = args.baud
+    host = args.host
+
+    intf = None
+
+    if host is not None:
+        # Ethernet interface
+        intf = xfcp.interface.UDPInterface(host, window=args.window)
+    else:
+        # serial interface
+        intf = xfcp.interface.SerialInterface(port, baud, window=args.window)
+
+    with xfcp.proxy.Proxy(intf, timeout=args.timeout) as proxy:
+        if proxy.max_packet_size:
+            print("Max packet size %d bytes, less 3 for clients without a 2 byte rpath tag" % proxy.max_packet_size)
+
+        if args.listen:
+            listen_host, listen_port = args.listen.rsplit(':', 1)
+            proxy.listen_udp(listen_host, int(listen_port))
+            print("Listening on UDP %s" % args.listen)
+
+        if args.unix:
+            proxy.listen_unix(args.unix)
+            print("Listening on %s" % args.unix)
+
+        try:
+            proxy.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+        print("%d requests, %d responses, %d timed out, %d duplicates, %d oversize, %d dropped" % (
+            proxy.requests, proxy.responses, proxy.timeouts, proxy.duplicates, proxy.oversize, proxy.dropped))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+../python/xfcp/cobs_codec.py
\ No newline at end of file
@@ -26,62 +26,7 @@ from myhdl import *
 import axis_ep
 import struct
 
-def cobs_encode(block):
-    block = bytearray(block)
-    enc = bytearray()
-
-    seg = bytearray()
-    code = 1
-
-    new_data = True
-
-    for b in block:
-        if b == 0:
-            enc.append(code)
-            enc.extend(seg)
-            code = 1
-            seg = bytearray()
-            new_data = True
-        else:
-            code += 1
-            seg.append(b)
-            new_data = True
-            if code == 255:
-                enc.append(code)
-                enc.extend(seg)
-                code = 1
-                seg = bytearray()
-                new_data = False
-
-    if new_data:
-        enc.append(code)
-        enc.extend(seg)
-
-    return bytes(enc)
-
-def cobs_decode(block):
-    block = bytearray(block)
-    dec = bytearray()
-
-    it = iter(bytearray(block))
-    code = 0
-
-    i = 0
-
-    if 0 in block:
-        return None
-
-    while i < len(block):
-        code = block[i]
-        i += 1
-        if i+code-1 > len(block):
-            return None
-        dec.extend(block[i:i+code-1])
-        i += code-1
-        if code < 255 and i < len(block):
-            dec.append(0)
-
-    return bytes(dec)
+from cobs_codec import cobs_encode, cobs_decode
 
 
 class XFCPFrame(object):